@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Benchmarks the hot paths of rest_data_process on synthetic tweet files at
+one or more scales.  Each benchmark runs in its own process, so its peak
+memory is its own, and the best time of a few repeats is kept.  Results are
+appended to a JSON file under the git commit they were measured at and are
+printed next to the last run of another commit with the same settings.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+from collections import OrderedDict
+
+import rest_data_process
+from rest_data_process import timely_data, unique_tweets, wordcounts_by_lang, \
+    tweet_histogram, geo_count, remove_retweets, quake_from_filename, \
+    english_tokenizer
+from histogram import epoch_seconds
+from synth_tweets import TweetGenerator, write_tweets, synth_filename, LANGS
+
+BENCH_DIR = "bench_data"
+RESULTS_FILE = "bench_results.json"
+
+'''--------------------------------------------------------------------------'''
+'''Benchmarks'''
+'''--------------------------------------------------------------------------'''
+# Each benchmark is a setup, run untimed, and a timed run of the state the
+# setup returns.
+
+#   load_tweets :: Filename -> IO [Dict]
+def load_tweets(filename):
+    with open(filename, "r") as tweet_file:
+        return [json.loads(line) for line in tweet_file if line.strip()]
+
+def no_setup(filename):
+    return filename
+
+def bench_timely_data(filename):
+    with open(filename, "r") as tweet_file:
+        timely_data(tweet_file, quake_from_filename(filename).date)
+
+def setup_wordcounts(filename):
+    english_tokenizer()
+    return remove_retweets(load_tweets(filename))
+
+def setup_histogram(filename):
+    return (remove_retweets(load_tweets(filename)),
+            epoch_seconds(quake_from_filename(filename).date))
+
+def bench_main_geo(filename):
+    argv = sys.argv
+    stdout = sys.stdout
+    sys.argv = [argv[0], filename]
+    sys.stdout = open(os.devnull, "w")
+    try:
+        rest_data_process.main_geo()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        sys.argv = argv
+
+BENCHMARKS = OrderedDict([
+    ("timely_data", (no_setup, bench_timely_data)),
+    ("unique_tweets", (load_tweets, unique_tweets)),
+    ("wordcounts_by_lang", (setup_wordcounts, wordcounts_by_lang)),
+    ("tweet_histogram", (setup_histogram, lambda x: tweet_histogram(*x))),
+    ("geo_count", (load_tweets, geo_count)),
+    ("main_geo", (no_setup, bench_main_geo)),
+])
+
+#   peak_kb :: () -> Int
+def peak_kb():
+    """Peak resident memory of this process, in KB on linux"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#   run_child :: String -> Filename -> IO Dict
+def run_child(name, filename):
+    """Runs one benchmark in this process"""
+    (setup, run) = BENCHMARKS[name]
+    state = setup(filename)
+    setup_kb = peak_kb()
+    start = time.time()
+    run(state)
+    seconds = time.time() - start
+    return {"seconds": seconds, "setup_kb": setup_kb, "peak_kb": peak_kb()}
+
+#   measure :: String -> Filename -> Int -> IO Dict
+def measure(name, filename, repeats):
+    """The best of repeats runs of a benchmark, each in a fresh process"""
+    best = None
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, __file__,
+                                          "--child", name, filename])
+        result = json.loads(output.splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+'''--------------------------------------------------------------------------'''
+'''Data and results'''
+'''--------------------------------------------------------------------------'''
+#   dataset :: Int -> Dict -> Filename -> IO Filename
+def dataset(count, params, bench_dir):
+    """The synthetic tweet file of these settings, generated once"""
+    directory = os.path.join(bench_dir, "{0}_{1}_{2}_{3}_{4}_{5}".format(
+        count, params["seed"], params["duplicates"], params["retweets"],
+        params["geo"], params["langs"].replace(":", "-").replace(",", "_")))
+    filename = os.path.join(directory, synth_filename())
+    if not os.path.exists(filename):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        print("generating {0} tweets".format(count), file=sys.stderr)
+        write_tweets(filename, count, TweetGenerator(**params))
+    return filename
+
+#   git_commit :: () -> IO (String, Bool)
+def git_commit():
+    """The commit checked out and whether tracked files differ from it"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"]).strip()
+        changes = subprocess.check_output(["git", "status", "--porcelain",
+                                           "--untracked-files=no"]).strip()
+        return (commit, bool(changes))
+    except (OSError, subprocess.CalledProcessError):
+        return ("unknown", True)
+
+#   load_results :: Filename -> IO [Dict]
+def load_results(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename, "r") as results_file:
+        return json.load(results_file)
+
+#   save_results :: Filename -> [Dict] -> IO ()
+def save_results(filename, runs):
+    with open(filename + ".tmp", "w") as results_file:
+        json.dump(runs, results_file, indent=1, sort_keys=True)
+    os.rename(filename + ".tmp", filename)
+
+#   baseline_run :: [Dict] -> Dict -> Maybe Dict
+def baseline_run(runs, current):
+    """The last run of another commit with the same settings"""
+    for run in reversed(runs):
+        if run["commit"] != current["commit"] and \
+           run["count"] == current["count"] and \
+           run["params"] == current["params"] and \
+           run["python"] == current["python"]:
+            return run
+    return None
+
+#   print_run :: Dict -> Maybe Dict -> IO ()
+def print_run(run, baseline):
+    print("{0} tweets at {1}{2}".format(run["count"], run["commit"][:10],
+                                        " (dirty)" if run["dirty"] else ""))
+    if baseline is not None:
+        print("compared with {0}".format(baseline["commit"][:10]))
+    for (name, result) in sorted(run["results"].items(),
+                                 key=lambda x: BENCHMARKS.keys().index(x[0])):
+        line = "{0:<22}{1:>10.3f}s{2:>14.0f}/s{3:>10.1f}MB".format(
+            name, result["seconds"], result["lines_per_second"],
+            result["peak_kb"] / 1024.0)
+        if baseline is not None and name in baseline["results"]:
+            line += "{0:>8.2f}x".format(
+                baseline["results"][name]["seconds"] /
+                max(result["seconds"], 1e-9))
+        print(line)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('-n', '--count', type=int, nargs='+', default=[10000],
+                        help='Tweets per file, one run per count.')
+    parser.add_argument('-b', '--bench', nargs='+', choices=BENCHMARKS.keys(),
+                        default=BENCHMARKS.keys())
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicates', type=float, default=0.02)
+    parser.add_argument('--retweets', type=float, default=0.3)
+    parser.add_argument('--geo', type=float, default=0.02)
+    parser.add_argument('--langs', default=LANGS)
+    parser.add_argument('--bench-dir', default=BENCH_DIR,
+                        help='Where the synthetic files are kept.')
+    parser.add_argument('--results', default=RESULTS_FILE,
+                        help='JSON file the runs are appended to.')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if args.child:
+        print(json.dumps(run_child(*args.child)))
+        return
+    params = {"seed": args.seed, "duplicates": args.duplicates,
+              "retweets": args.retweets, "geo": args.geo, "langs": args.langs}
+    (commit, dirty) = git_commit()
+    runs = load_results(args.results)
+    for count in args.count:
+        filename = dataset(count, params, args.bench_dir)
+        results = {}
+        for name in args.bench:
+            result = measure(name, filename, args.repeats)
+            result["lines_per_second"] = count / max(result["seconds"], 1e-9)
+            results[name] = result
+        run = {"commit": commit, "dirty": dirty, "count": count,
+               "params": params, "results": results,
+               "python": platform.python_version(),
+               "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+        print_run(run, baseline_run(runs, run))
+        runs.append(run)
+        save_results(args.results, runs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Online burst detection over per region tweet rates.  Tweets are counted in
+minute buckets per region (a grid cell of their coordinates, or the world
+for tweets without any), each region keeps an EWMA baseline of its rate, and
+a one sided CUSUM of the deviations from that baseline raises a burst when
+it crosses a threshold.  Every tweet costs O(1), and the running minute is
+checked as it fills, so a burst is raised without waiting for its minute to
+end.
+"""
+
+from __future__ import print_function
+
+import sys
+import math
+import logging
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from tweet_time import parse_created_at, TWEET_FORMAT
+from histogram import MINUTE
+from quake_index import CELL_DEGREES
+
+WORLD = "world"
+# weight of the newest minute in the baseline
+ALPHA = 0.05
+# slack per minute and threshold of the CUSUM, in standard deviations
+SLACK = 0.5
+THRESHOLD = 5.0
+# no burst with fewer tweets in its minute, whatever the baseline
+MIN_COUNT = 5
+# minutes a region is watched before it can burst
+WARMUP = 30
+# empty minutes closed one by one, longer gaps leave the baseline at rest
+MAX_GAP = 120
+
+# tweets per minute of the regions of the --check replay, the first one of
+# them the world, and the minutes it lasts
+CHECK_RATES = [5, 20, 100]
+CHECK_MINUTES = 4 * 60
+
+BurstEvent = namedtuple("BurstEvent", ["region", "minute", "count",
+                                       "baseline", "score"])
+
+#   region_of :: Dict -> Region
+def region_of(tweet, cell_degrees=CELL_DEGREES):
+    """The "lat,lon" grid cell of a geotagged tweet, else WORLD"""
+    if "coordinates" in tweet and tweet["coordinates"] != None:
+        (lon, lat) = tweet["coordinates"]["coordinates"][:2]
+        return "{0},{1}".format(
+            int(math.floor((lat + 90) / cell_degrees)),
+            int(math.floor((lon + 180) / cell_degrees)))
+    return WORLD
+
+class MinuteClock(object):
+    """
+    created_at strings to epoch minutes, with parse_created_at converting
+    each distinct minute once instead of every tweet.
+    """
+    #   minute :: String -> Maybe Int
+    def minute(self, created_at):
+        try:
+            return parse_created_at(created_at) // MINUTE
+        except (ValueError, TypeError):
+            return None
+
+class RegionRate(object):
+    """EWMA baseline and CUSUM of the per minute tweet count of one region"""
+    __slots__ = ("minute", "count", "mean", "var", "cusum", "watched",
+                 "bursting")
+
+    def __init__(self, minute):
+        self.minute = minute
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.cusum = 0.0
+        self.watched = 0
+        self.bursting = False
+
+    #   score :: Int -> Float
+    def score(self, count):
+        """The CUSUM if the current minute ended with count tweets"""
+        deviation = (count - self.mean) / math.sqrt(self.var + 1.0)
+        return max(0.0, self.cusum + deviation - SLACK)
+
+    def _close(self, count):
+        """
+        Folds a finished minute into the CUSUM and then the baseline.  The
+        first minute is the baseline, and the CUSUM only starts once the
+        baseline had WARMUP minutes to settle.
+        """
+        if not self.watched:
+            self.mean = float(count)
+        elif self.watched >= WARMUP:
+            self.cusum = self.score(count)
+            if self.cusum == 0.0:
+                self.bursting = False
+        delta = count - self.mean
+        self.mean += ALPHA * delta
+        self.var = (1 - ALPHA) * (self.var + ALPHA * delta * delta)
+        self.watched += 1
+
+    #   advance :: Int -> ()
+    def advance(self, minute):
+        """Closes the minutes before minute"""
+        if minute <= self.minute:
+            return
+        self._close(self.count)
+        for _ in range(min(minute - self.minute - 1, MAX_GAP)):
+            self._close(0)
+        self.minute = minute
+        self.count = 0
+
+class BurstDetector(object):
+    """
+    Tweet rates of every region.  add returns a BurstEvent the first time a
+    region's CUSUM crosses THRESHOLD, and again only after it falls back to
+    zero.  Tweets older than their region's current minute still count
+    towards it rather than being dropped.
+    """
+    def __init__(self, region=region_of, clock=None):
+        self.region = region
+        self.clock = clock or MinuteClock()
+        self.regions = {}
+
+    #   add :: Dict -> Maybe BurstEvent
+    def add(self, tweet):
+        if "created_at" not in tweet:
+            return None
+        minute = self.clock.minute(tweet["created_at"])
+        if minute is None:
+            return None
+        region = self.region(tweet)
+        rate = self.regions.get(region)
+        if rate is None:
+            rate = self.regions[region] = RegionRate(minute)
+        rate.advance(minute)
+        rate.count += 1
+        if rate.bursting or rate.watched < WARMUP or rate.count < MIN_COUNT:
+            return None
+        score = rate.score(rate.count)
+        if score < THRESHOLD:
+            return None
+        rate.bursting = True
+        return BurstEvent(region=region, minute=rate.minute, count=rate.count,
+                          baseline=rate.mean, score=score)
+
+    #   detect :: Iterator Dict -> Iterator BurstEvent
+    def detect(self, tweets):
+        for tweet in tweets:
+            event = self.add(tweet)
+            if event is not None:
+                yield event
+
+#   format_event :: BurstEvent -> String
+def format_event(event):
+    date = datetime.utcfromtimestamp(event.minute * MINUTE)
+    return "{0}\t{1}\t{2}\t{3:.2f}\t{4:.2f}".format(
+        date.strftime("%Y-%m-%d %H:%M"), event.region, event.count,
+        event.baseline, event.score)
+
+#   constant_tweets :: [Int] -> Int -> Datetime -> Iterator Dict
+def constant_tweets(rates, minutes, start=datetime(2014, 11, 16)):
+    """
+    Tweets at a constant rate per minute in each of some regions, spread
+    evenly over each minute: the first region is the world, the others are
+    grid cells 10 degrees apart.
+    """
+    for minute in range(minutes):
+        for second in range(MINUTE):
+            created_at = (start + timedelta(minutes=minute, seconds=second)
+                          ).strftime(TWEET_FORMAT)
+            for (region, rate) in enumerate(rates):
+                for _ in range(rate * (second + 1) // MINUTE -
+                               rate * second // MINUTE):
+                    tweet = {"created_at": created_at}
+                    if region:
+                        tweet["coordinates"] = {
+                            "type": "Point",
+                            "coordinates": [10.0 * region, 10.0 * region]}
+                    yield tweet
+
+#   check_constant_rate :: () -> [BurstEvent]
+def check_constant_rate():
+    """The bursts raised by constant_tweets of CHECK_RATES, there should be
+    none"""
+    return list(BurstDetector().detect(constant_tweets(CHECK_RATES,
+                                                       CHECK_MINUTES)))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('-r', '--replay', nargs='+',
+                        help='Replay JSONL tweet files instead of streaming.')
+    parser.add_argument('--check', action='store_true',
+                        help='Replay tweets at constant rates, which must '
+                        'not raise any burst, and exit.')
+    try:
+        from stream_example import add_stream_arguments
+        add_stream_arguments(parser, required=False)
+    except ImportError:
+        # no twitter package, only --replay works
+        pass
+    return parser.parse_args()
+
+def main():
+    from stream_pipeline import replay_source, twitter_source
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments()
+    if args.check:
+        events = check_constant_rate()
+        for event in events:
+            print(format_event(event))
+        logging.info("{0} bursts at constant rates {1}".format(
+            len(events), CHECK_RATES))
+        sys.exit(1 if events else 0)
+    if args.replay:
+        source = replay_source(args.replay, in_time_order=True)
+    else:
+        source = twitter_source(args)
+    for event in BurstDetector().detect(source):
+        print(format_event(event))
+
+if __name__ == "__main__":
+    main()
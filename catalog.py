@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+A store of USGS earthquake catalogs.  GeoJSON feeds are read a feature at a
+time, so a feed of hundreds of MB is never decoded whole, into a table of
+time, magnitude, lat, lon and event id sorted by time.  The store is a
+directory of .npy files, the table and its indexes by magnitude, latitude
+and event id, that are memory mapped when loaded.  Merging a new download
+replaces the events it has again and inserts the new ones; queries by time
+range, minimum magnitude and bounding box start from the index that leaves
+the fewest rows to check.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import re
+import json
+import calendar
+import logging
+import argparse
+
+import numpy as np
+
+from tweet_io import file_chunks, CHUNK_SIZE
+from tweet_time import parse_quake_date, millis_datetime
+
+QUAKE_DTYPE = np.dtype([("time", np.int64), ("mag", np.float64),
+                        ("lat", np.float64), ("lon", np.float64),
+                        ("id", "S32")])
+TABLE_FILE = "quakes.npy"
+# each index is its key, sorted, next to the row of the table it is from
+INDEXES = {"mag": np.float64, "lat": np.float64, "id": "S32"}
+# features turned into table rows at once while reading a feed
+BATCH_SIZE = 65536
+FEATURES_RE = re.compile(r'"features"\s*:\s*\[')
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+'''--------------------------------------------------------------------------'''
+'''Feeds'''
+'''--------------------------------------------------------------------------'''
+#   iter_features :: Filename -> IO Iterator Dict
+def iter_features(filename):
+    """
+    The features of a GeoJSON feed, plain or compressed, decoded one at a
+    time from the chunks of the file.
+    """
+    decoder = json.JSONDecoder()
+    chunks = file_chunks(filename)
+    data = ""
+    for chunk in chunks:
+        data += chunk
+        match = FEATURES_RE.search(data)
+        if match:
+            data = data[match.end():]
+            break
+        # the key may be cut between two chunks
+        data = data[-32:]
+    else:
+        raise ValueError("{0} has no features".format(filename))
+    position = 0
+    while True:
+        position = SEPARATOR_RE.match(data, position).end()
+        if position < len(data) and data[position] == "]":
+            return
+        try:
+            if position == len(data):
+                raise ValueError("end of the data read")
+            (feature, position) = decoder.raw_decode(data, position)
+        except ValueError:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("{0} ends inside its features".format(
+                    filename))
+            (data, position) = (data[position:] + chunk, 0)
+            continue
+        yield feature
+        if position > CHUNK_SIZE:
+            (data, position) = (data[position:], 0)
+
+#   feature_row :: Dict -> (Int, Float, Float, Float, String)
+def feature_row(feature):
+    """The table row of a feature, NaN for an unknown magnitude"""
+    properties = feature["properties"]
+    (lon, lat) = feature["geometry"]["coordinates"][:2]
+    mag = properties["mag"]
+    event = feature.get("id")
+    if event is None:
+        # feeds without ids tell events apart by time and place
+        event = "{0}@{1},{2}".format(properties["time"], lat, lon)
+    event = event.encode("utf-8") if isinstance(event, unicode) else event
+    if len(event) > QUAKE_DTYPE["id"].itemsize:
+        raise ValueError("event id {0} is too long".format(event))
+    return (properties["time"], np.nan if mag is None else mag, lat, lon,
+            event)
+
+#   unique_events :: Array -> Array
+def unique_events(rows):
+    """The last row of each event id, sorted by time"""
+    (_, last) = np.unique(rows["id"][::-1], return_index=True)
+    rows = rows[len(rows) - 1 - last]
+    return rows[np.argsort(rows["time"], kind="mergesort")]
+
+#   feed_table :: Filename -> IO Array
+def feed_table(filename):
+    """The rows of a feed, one per event, sorted by time"""
+    batches = []
+    rows = []
+    for feature in iter_features(filename):
+        rows.append(feature_row(feature))
+        if len(rows) >= BATCH_SIZE:
+            batches.append(np.array(rows, dtype=QUAKE_DTYPE))
+            rows = []
+    batches.append(np.array(rows, dtype=QUAKE_DTYPE))
+    return unique_events(np.concatenate(batches))
+
+#   row_values :: Array -> Iterator (Int, Maybe Float, Float, Float, String)
+def row_values(rows):
+    """The rows as python values, None for an unknown magnitude"""
+    for (time, mag, lat, lon, event) in rows.tolist():
+        yield (time, None if mag != mag else mag, lat, lon, event)
+
+#   epoch_millis :: Datetime -> Int
+def epoch_millis(date):
+    return calendar.timegm(date.utctimetuple()) * 1000 + \
+        date.microsecond // 1000
+
+'''--------------------------------------------------------------------------'''
+'''Store'''
+'''--------------------------------------------------------------------------'''
+class Catalog(object):
+    """
+    Quakes sorted by time with their indexes, kept in the directory path
+    when there is one, else only in memory.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.table = np.zeros(0, dtype=QUAKE_DTYPE)
+        self.indexes = {}
+        if path is not None and os.path.exists(self._file(TABLE_FILE)):
+            self.table = np.load(self._file(TABLE_FILE), mmap_mode="r")
+            for key in INDEXES:
+                index_file = self._file(key + ".npy")
+                if os.path.exists(index_file):
+                    index = np.load(index_file, mmap_mode="r")
+                    if len(index) == len(self.table):
+                        self.indexes[key] = index
+        self._index(key for key in INDEXES if key not in self.indexes)
+
+    def __len__(self):
+        return len(self.table)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _index(self, keys):
+        for key in keys:
+            order = np.argsort(self.table[key], kind="mergesort")
+            index = np.zeros(len(order), dtype=[("key", INDEXES[key]),
+                                                ("row", np.int64)])
+            index["key"] = self.table[key][order]
+            index["row"] = order
+            self.indexes[key] = index
+
+    #   merge :: Array -> (Int, Int)
+    def merge(self, rows):
+        """
+        Adds the rows of a feed, replacing the rows of the events it has
+        again.  Returns the counts of new and of replaced events.
+        """
+        rows = unique_events(rows)
+        by_id = self.indexes["id"]
+        at = np.minimum(np.searchsorted(by_id["key"], rows["id"]),
+                        max(len(by_id) - 1, 0))
+        found = (by_id["key"][at] == rows["id"]) if len(by_id) else \
+            np.zeros(len(rows), dtype=bool)
+        kept = np.delete(self.table, by_id["row"][at[found]])
+        self.table = np.insert(kept, np.searchsorted(kept["time"],
+                                                     rows["time"],
+                                                     side="right"), rows)
+        self._index(INDEXES)
+        return (int(len(rows) - found.sum()), int(found.sum()))
+
+    #   merge_feed :: Filename -> IO (Int, Int)
+    def merge_feed(self, filename):
+        return self.merge(feed_table(filename))
+
+    #   save :: () -> IO ()
+    def save(self):
+        """Writes the table and indexes, each through a temporary file"""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        arrays = [(TABLE_FILE, self.table)] + \
+            [(key + ".npy", index) for (key, index) in self.indexes.items()]
+        for (name, array) in arrays:
+            with open(self._file(name) + ".tmp", "wb") as array_file:
+                np.save(array_file, np.asarray(array))
+            os.rename(self._file(name) + ".tmp", self._file(name))
+
+    def _candidates(self, start, end, min_mag, bbox):
+        """The rows some index narrows the query to, the fewest of them"""
+        time = self.table["time"]
+        low = 0 if start is None else np.searchsorted(time, start)
+        high = len(time) if end is None else \
+            np.searchsorted(time, end, side="right")
+        best = np.arange(low, high)
+        choices = []
+        if min_mag is not None:
+            by_mag = self.indexes["mag"]
+            choices.append(by_mag["row"][np.searchsorted(by_mag["key"],
+                                                         min_mag):])
+        if bbox is not None:
+            by_lat = self.indexes["lat"]
+            choices.append(by_lat["row"][
+                np.searchsorted(by_lat["key"], bbox[1]):
+                np.searchsorted(by_lat["key"], bbox[3], side="right")])
+        for rows in choices:
+            if len(rows) < len(best):
+                best = rows
+        return np.sort(best)
+
+    #   query :: Maybe Int -> Maybe Int -> Maybe Float -> Maybe (Float, Float, Float, Float) -> Array
+    def query(self, start=None, end=None, min_mag=None, bbox=None):
+        """
+        The rows, by time, from start to end (epoch milliseconds, both
+        included), of magnitude at least min_mag and inside bbox, given as
+        (west, south, east, north) like a GeoJSON bbox.  A bbox whose west
+        is east of its east crosses the antimeridian.
+        """
+        rows = self.table[self._candidates(start, end, min_mag, bbox)]
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            keep &= rows["time"] >= start
+        if end is not None:
+            keep &= rows["time"] <= end
+        if min_mag is not None:
+            keep &= rows["mag"] >= min_mag
+        if bbox is not None:
+            (west, south, east, north) = bbox
+            keep &= (rows["lat"] >= south) & (rows["lat"] <= north)
+            if west <= east:
+                keep &= (rows["lon"] >= west) & (rows["lon"] <= east)
+            else:
+                keep &= (rows["lon"] >= west) | (rows["lon"] <= east)
+        return rows[keep]
+
+'''--------------------------------------------------------------------------'''
+#   add_query_arguments :: ArgumentParser -> ()
+def add_query_arguments(parser):
+    parser.add_argument('--start', type=parse_quake_date,
+                        help='First quake time, like 2014-11-16_00:00:00.')
+    parser.add_argument('--end', type=parse_quake_date,
+                        help='Last quake time, like 2014-11-17_00:00:00.')
+    parser.add_argument('--min-mag', type=float,
+                        help='Smallest magnitude kept.')
+    parser.add_argument('--bbox', type=float, nargs=4,
+                        metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+                        help='Only the quakes inside this box.')
+
+#   query_arguments :: Namespace -> Dict
+def query_arguments(args):
+    """The keyword arguments of Catalog.query from add_query_arguments"""
+    return {"start": None if args.start is None else epoch_millis(args.start),
+            "end": None if args.end is None else epoch_millis(args.end),
+            "min_mag": args.min_mag, "bbox": args.bbox}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('store', help='Catalog directory.')
+    parser.add_argument('feeds', nargs='*',
+                        help='USGS GeoJSON feeds merged into the store.')
+    add_query_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments()
+    catalog = Catalog(args.store)
+    for feed in args.feeds:
+        (added, replaced) = catalog.merge_feed(feed)
+        logging.info("{0}: {1} new and {2} updated quakes".format(
+            feed, added, replaced))
+    if args.feeds:
+        catalog.save()
+    for (time, mag, lat, lon, event) in row_values(
+            catalog.query(**query_arguments(args))):
+        print("{0}\t{1}\t{2}\t{3}\t{4}".format(
+            millis_datetime(time).strftime("%Y-%m-%d %H:%M:%S"), mag, lat,
+            lon, event))
+
+if __name__ == "__main__":
+    main()
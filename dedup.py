@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Streaming removal of duplicate tweets by id.  The ids seen so far are kept in
+a compact integer set that can be saved to disk and loaded again, so the same
+set can be shared across files and across runs.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+
+import numpy as np
+
+class IdSet(object):
+    """
+    Set of integer tweet ids.  Most ids live in a sorted int64 array (8 bytes
+    each); new ids go to a small python set that is merged into the array
+    when it fills up.  With a path, the saved ids are memory mapped on load.
+    """
+    def __init__(self, path=None, buffer_size=65536):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._recent = set()
+        if path is not None and os.path.exists(path):
+            self._sorted = np.load(path, mmap_mode='r')
+        else:
+            self._sorted = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def __contains__(self, tweet_id):
+        if tweet_id in self._recent:
+            return True
+        index = np.searchsorted(self._sorted, tweet_id)
+        return index < len(self._sorted) and self._sorted[index] == tweet_id
+
+    #   add :: Id -> Bool
+    def add(self, tweet_id):
+        """Adds the id and returns whether it was new"""
+        if tweet_id in self:
+            return False
+        self._recent.add(tweet_id)
+        # grows with the array so merging stays linear overall
+        if len(self._recent) >= max(self.buffer_size, len(self._sorted) // 16):
+            self._merge()
+        return True
+
+    def _merge(self):
+        if not self._recent:
+            return
+        recent = np.fromiter(self._recent, dtype=np.int64,
+                             count=len(self._recent))
+        recent.sort()
+        self._sorted = np.insert(self._sorted,
+                                 np.searchsorted(self._sorted, recent), recent)
+        self._recent = set()
+
+    #   save :: Filename -> IO ()
+    def save(self, path=None):
+        """Writes the ids, through a temporary file as they may be mapped"""
+        self._merge()
+        path = path or self.path
+        with open(path + ".tmp", "wb") as ids_file:
+            np.save(ids_file, self._sorted)
+        os.rename(path + ".tmp", path)
+
+#   unique_by_id :: Iterable Dict -> IdSet -> Iterator Dict
+def unique_by_id(tweets, seen=None):
+    """
+    Yields each tweet the first time its id is seen, dropping the tweets
+    without an id.  Pass the same seen set to dedup across calls.
+    """
+    if seen is None:
+        seen = IdSet()
+    for tweet in tweets:
+        if "id" in tweet and seen.add(tweet["id"]):
+            yield tweet
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+The tweet activity of a whole set of quakes as one matrix: a row per quake
+and a column per fixed width bin of time relative to the quake, from 2 hours
+before it to 4 hours after, so bin k of every row is the same moment after
+its quake.  The matrix and a table of the quakes (time, magnitude, place and
+file) are kept as .npy files, memory mapped when loaded, so thousands of
+quakes are compared without reading their tweets again.  The queries work on
+all the rows at once: the lag of the peak after the quake, the rate at which
+the activity decays after it and the volume after the quake normalized by
+magnitude.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import json
+import logging
+import argparse
+import functools
+import multiprocessing
+
+import numpy as np
+
+from histogram import epoch_seconds, MINUTE, QUARTER_HOUR, HOUR
+from rest_data_process import quake_from_filename, file_timely_data, \
+    remove_retweets, add_source_arguments, WINDOW_BEFORE, WINDOW_AFTER, \
+    READ_RAW
+from tweet_record import tweet_epoch
+
+COUNTS_FILE = "counts.npy"
+QUAKES_FILE = "quakes.npy"
+META_FILE = "meta.json"
+# the name is the basename of the quake file, its size set when saved
+QUAKE_FIELDS = [("time", np.int64), ("mag", np.float64), ("lat", np.float64),
+                ("lon", np.float64)]
+# magnitude the volumes are scaled to, divided by ten for each magnitude
+# above it as the amplitude of the shaking grows tenfold
+REFERENCE_MAG = 5.0
+
+#   quake_table :: [(Int, Float, Float, Float, String)] -> Array
+def quake_table(rows):
+    """The quake table of some (time, mag, lat, lon, name) rows"""
+    size = max([len(x[-1]) for x in rows] + [1])
+    return np.array(rows, dtype=QUAKE_FIELDS + [("name", "S{0}".format(size))])
+
+#   window_bins :: Int -> Int
+def window_bins(width):
+    """The columns of a matrix of bins width seconds wide"""
+    seconds = int((WINDOW_BEFORE + WINDOW_AFTER).total_seconds())
+    return -(-seconds // width)
+
+#   quake_counts :: [Int] -> Int -> Int -> Array Int
+def quake_counts(times, origin, width):
+    """
+    The row of the tweets at times (epoch seconds) of a quake at origin.
+    The window holds its last second, which is counted in the last bin.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    before = int(WINDOW_BEFORE.total_seconds())
+    after = int(WINDOW_AFTER.total_seconds())
+    columns = window_bins(width)
+    times = times[(times >= origin - before) & (times <= origin + after)]
+    bins = np.minimum((times - origin + before) // width, columns - 1)
+    return np.bincount(bins, minlength=columns).astype(np.int32)
+
+#   matrix_row :: Filename -> Source -> Int -> ((Int, Float, Float, Float, String), Array Int)
+def matrix_row(tweet_file, source=READ_RAW, width=QUARTER_HOUR):
+    """The quake table row and the counts row of a quake file"""
+    quake = quake_from_filename(tweet_file)
+    origin = epoch_seconds(quake.date)
+    tweets = remove_retweets(file_timely_data(tweet_file, quake.date, source,
+                                              compact=True))
+    return ((origin, quake.mag, quake.lat, quake.lon,
+             os.path.basename(tweet_file)),
+            quake_counts([tweet_epoch(x) for x in tweets], origin, width))
+
+'''--------------------------------------------------------------------------'''
+'''Store'''
+'''--------------------------------------------------------------------------'''
+class EventMatrix(object):
+    """
+    The counts of quakes, a row each sorted by quake time, with their quake
+    table, kept in the directory path when there is one.
+    """
+    def __init__(self, path=None, width=QUARTER_HOUR):
+        self.path = path
+        self.width = width
+        self.quakes = quake_table([])
+        self.counts = np.zeros((0, window_bins(width)), dtype=np.int32)
+        if path is not None and os.path.exists(self._file(META_FILE)):
+            with open(self._file(META_FILE), "r") as meta:
+                self.width = json.load(meta)["width"]
+            self.quakes = np.load(self._file(QUAKES_FILE), mmap_mode="r")
+            self.counts = np.load(self._file(COUNTS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.quakes)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def offsets(self):
+        """Seconds from the quake to the start of each bin"""
+        return np.arange(self.counts.shape[1]) * self.width - \
+            int(WINDOW_BEFORE.total_seconds())
+
+    #   add :: [(Int, Float, Float, Float, String)] -> [Array Int] -> ()
+    def add(self, quakes, counts):
+        """Adds rows, replacing those of the quake files already in it"""
+        if not quakes:
+            return
+        quakes = quake_table(quakes)
+        kept = ~np.in1d(self.quakes["name"], quakes["name"])
+        size = max(self.quakes["name"].dtype.itemsize,
+                   quakes["name"].dtype.itemsize)
+        dtype = np.dtype(QUAKE_FIELDS + [("name", "S{0}".format(size))])
+        table = np.concatenate([self.quakes[kept].astype(dtype),
+                                quakes.astype(dtype)])
+        matrix = np.concatenate([self.counts[kept],
+                                 np.array(counts, dtype=np.int32)])
+        order = np.argsort(table["time"], kind="mergesort")
+        (self.quakes, self.counts) = (table[order], matrix[order])
+
+    #   save :: () -> IO ()
+    def save(self):
+        """Writes the counts, quakes and bins, each through a tmp file"""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for (name, array) in [(COUNTS_FILE, self.counts),
+                              (QUAKES_FILE, self.quakes)]:
+            with open(self._file(name) + ".tmp", "wb") as array_file:
+                np.save(array_file, np.asarray(array))
+            os.rename(self._file(name) + ".tmp", self._file(name))
+        with open(self._file(META_FILE) + ".tmp", "w") as meta:
+            json.dump({"width": self.width,
+                       "before": int(WINDOW_BEFORE.total_seconds()),
+                       "after": int(WINDOW_AFTER.total_seconds())}, meta)
+        os.rename(self._file(META_FILE) + ".tmp", self._file(META_FILE))
+
+'''--------------------------------------------------------------------------'''
+'''Queries'''
+'''--------------------------------------------------------------------------'''
+#   peak_lag :: Array Int -> Array Int -> Array Float
+def peak_lag(counts, offsets):
+    """
+    Seconds from each quake to the start of its busiest bin after it, NaN
+    for a quake without tweets after it.
+    """
+    after = np.asarray(counts)[:, offsets >= 0]
+    lag = offsets[offsets >= 0][after.argmax(axis=1)].astype(np.float64)
+    lag[~after.any(axis=1)] = np.nan
+    return lag
+
+#   decay_rate :: Array Int -> Array Int -> Array Float
+def decay_rate(counts, offsets):
+    """
+    The rate (per hour) at which the tweets of each quake decay from their
+    peak after it, the slope of a least squares line through the log of the
+    counts of the bins from the peak on that have tweets.  NaN for a quake
+    with fewer than two such bins.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    lag = peak_lag(counts, offsets)
+    fit = (offsets[None, :] >= np.where(np.isnan(lag), np.inf,
+                                        lag)[:, None]) & (counts > 0)
+    hours = np.where(fit, offsets[None, :] / float(HOUR), 0.0)
+    logs = np.where(fit, np.log(np.maximum(counts, 1)), 0.0)
+    n = fit.sum(axis=1)
+    (sum_x, sum_y) = (hours.sum(axis=1), logs.sum(axis=1))
+    spread = n * (hours * hours).sum(axis=1) - sum_x * sum_x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * (hours * logs).sum(axis=1) - sum_x * sum_y) / spread
+    return np.where(n >= 2, -slope, np.nan)
+
+#   normalized_volume :: Array Int -> Array Int -> Array Float -> Array Float
+def normalized_volume(counts, offsets, mags):
+    """
+    The tweets of each quake from its time on, scaled to a quake of
+    REFERENCE_MAG: divided by ten for each magnitude above it.
+    """
+    volume = np.asarray(counts)[:, offsets >= 0].sum(axis=1)
+    return volume / 10.0 ** (np.asarray(mags) - REFERENCE_MAG)
+
+# what main_matrix can sort the quakes by
+SORT_KEYS = ["time", "peak_lag", "decay", "volume"]
+
+'''--------------------------------------------------------------------------'''
+#   add_matrix_arguments :: ArgumentParser -> ()
+def add_matrix_arguments(parser):
+    parser.add_argument('matrix', help='Directory of the event matrix.')
+    parser.add_argument('tweet_files', nargs='*',
+                        help='Quake files named mag_lat_lon_date.json, added '
+                        'to the matrix unless they are in it.')
+    parser.add_argument('--width', type=int, default=QUARTER_HOUR,
+                        help='Seconds per bin of a new matrix.')
+    parser.add_argument('-r', '--rebuild', action='store_true',
+                        help='Count the given quake files again even if they '
+                        'are in the matrix.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Worker processes, each counting one quake file.')
+    add_source_arguments(parser)
+    parser.add_argument('--min-mag', type=float,
+                        help='Print only the quakes of this magnitude or more.')
+    parser.add_argument('--sort', choices=SORT_KEYS, default="time",
+                        help='Print the quakes by this, largest first.')
+    parser.add_argument('-n', '--top', type=int,
+                        help='Print only the first N quakes.')
+
+#   main_matrix :: Namespace -> IO ()
+def main_matrix(args):
+    matrix = EventMatrix(args.matrix, args.width)
+    known = set(matrix.quakes["name"])
+    new_files = [x for x in args.tweet_files if os.path.isfile(x) and
+                 (args.rebuild or os.path.basename(x) not in known)]
+    logging.info("# quakes in the matrix: {0}, to count: {1}".format(
+        len(matrix), len(new_files)))
+    if new_files:
+        count = functools.partial(matrix_row, source=args.source,
+                                  width=matrix.width)
+        if args.workers > 1 and len(new_files) > 1:
+            pool = multiprocessing.Pool(min(args.workers, len(new_files)))
+            try:
+                rows = pool.map(count, new_files)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            rows = map(count, new_files)
+        matrix.add([x for (x, _) in rows], [x for (_, x) in rows])
+        matrix.save()
+
+    offsets = matrix.offsets
+    (quakes, counts) = (matrix.quakes, matrix.counts)
+    if args.min_mag is not None:
+        keep = np.flatnonzero(quakes["mag"] >= args.min_mag)
+        (quakes, counts) = (quakes[keep], counts[keep])
+    (lags, rates, volumes) = (peak_lag(counts, offsets),
+                              decay_rate(counts, offsets),
+                              normalized_volume(counts, offsets,
+                                                quakes["mag"]))
+    order = np.arange(len(quakes))
+    if args.sort != "time":
+        key = {"peak_lag": lags, "decay": rates, "volume": volumes}[args.sort]
+        # largest first, the quakes it is NaN for last
+        order = np.argsort(np.where(np.isnan(key), np.inf, -key),
+                           kind="mergesort")
+    if args.top:
+        order = order[:args.top]
+    print("quake\tmag\tpeak_lag_min\tdecay_per_hour\tvolume")
+    for row in order:
+        print("{0}\t{1}\t{2:.0f}\t{3:.3f}\t{4:.1f}".format(
+            quakes["name"][row], quakes["mag"][row], lags[row] / MINUTE,
+            rates[row], volumes[row]))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    add_matrix_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    main_matrix(parse_arguments())
+
+if __name__ == "__main__":
+    main()
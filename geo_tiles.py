@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Bins the coordinates of geotagged tweets into a pyramid of web mercator tiles
+for the heatmap page.  Each tile of a zoom level is a json file of weighted
+cells, <zoom>/<x>/<y>.json, so the page only loads the tiles it is showing
+instead of every raw point.  The few low zooms, which show most of the world
+at once, are also a single <zoom>.json of the whole level.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import json
+import shutil
+import math
+import argparse
+import logging
+
+import numpy as np
+
+from rest_data_process import file_timely_data, quake_from_filename
+from dedup import IdSet, unique_by_id
+
+# each tile is split into 2**CELL_BITS by 2**CELL_BITS cells
+CELL_BITS = 5
+# mercator is undefined at the poles
+MAX_LAT = 85.0511287798
+COORD_DIGITS = 5
+# the zooms written as one file of the whole level, at most 4**3 tiles
+FULL_MAX_ZOOM = 3
+
+#   mercator :: Array Float -> Array Float -> (Array Float, Array Float)
+def mercator(lats, lons):
+    """Web mercator coordinates of points, both in [0, 1)"""
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_LAT, MAX_LAT)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = (lons + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    below_one = np.nextafter(1, 0)
+    return (np.clip(x, 0, below_one), np.clip(y, 0, below_one))
+
+#   inverse_mercator :: Array Float -> Array Float -> (Array Float, Array Float)
+def inverse_mercator(x, y):
+    lons = x * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * y))))
+    return (lats, lons)
+
+#   tile_level :: Array Float -> Array Float -> Int -> {String:[[Float]]}
+def tile_level(x, y, zoom, cell_bits=CELL_BITS):
+    """
+    The weighted cells of one zoom level, keyed by "x/y" of their tile, each
+    cell as [lat, lon, weight] of its center.
+    """
+    side = 2 ** (zoom + cell_bits)
+    cells_x = np.floor(x * side).astype(np.int64)
+    cells_y = np.floor(y * side).astype(np.int64)
+    (keys, weights) = np.unique(cells_x * side + cells_y, return_counts=True)
+    cells_x = keys // side
+    cells_y = keys % side
+    (lats, lons) = inverse_mercator((cells_x + 0.5) / side,
+                                    (cells_y + 0.5) / side)
+    tiles = {}
+    for (cell_x, cell_y, lat, lon, weight) in zip(cells_x, cells_y, lats, lons,
+                                                  weights):
+        tile = "{0}/{1}".format(cell_x >> cell_bits, cell_y >> cell_bits)
+        tiles.setdefault(tile, []).append([round(lat, COORD_DIGITS),
+                                           round(lon, COORD_DIGITS),
+                                           int(weight)])
+    return tiles
+
+#   tweet_coordinates :: [Dict] -> ([Float], [Float])
+def tweet_coordinates(tweets):
+    lats = []
+    lons = []
+    for tweet in tweets:
+        if "coordinates" in tweet and tweet["coordinates"] != None:
+            coordinates = tweet["coordinates"]
+            assert "type" in coordinates and coordinates["type"] == "Point"
+            lons.append(coordinates["coordinates"][0])
+            lats.append(coordinates["coordinates"][1])
+    return (lats, lons)
+
+#   write_json :: Filename -> a -> IO ()
+def write_json(filename, value):
+    with open(filename, "w") as out:
+        json.dump(value, out, separators=(',', ':'))
+
+#   write_pyramid :: [Float] -> [Float] -> Filename -> Int -> Int -> Int -> Int -> IO ()
+def write_pyramid(lats, lons, out_dir, min_zoom=0, max_zoom=12,
+                  cell_bits=CELL_BITS, full_max_zoom=FULL_MAX_ZOOM):
+    """
+    Writes out_dir/meta.json and the tiles of each level from min_zoom to
+    max_zoom as out_dir/<zoom>/<x>/<y>.json, replacing the tiles of an
+    earlier pyramid.  The levels up to full_max_zoom are written whole as
+    out_dir/<zoom>.json instead.
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    (x, y) = mercator(lats, lons)
+    for zoom in range(min_zoom, max_zoom + 1):
+        tiles = tile_level(x, y, zoom, cell_bits)
+        if zoom <= full_max_zoom:
+            write_json(os.path.join(out_dir, "{0}.json".format(zoom)),
+                       {"zoom": zoom, "tiles": tiles})
+            continue
+        level_dir = os.path.join(out_dir, str(zoom))
+        if os.path.isdir(level_dir):
+            shutil.rmtree(level_dir)
+        for (tile, cells) in tiles.iteritems():
+            (tile_x, tile_y) = tile.split("/")
+            column_dir = os.path.join(level_dir, tile_x)
+            if not os.path.isdir(column_dir):
+                os.makedirs(column_dir)
+            write_json(os.path.join(column_dir, tile_y + ".json"),
+                       {"zoom": zoom, "tile": tile, "cells": cells})
+        logging.info("zoom {0}: {1} tiles".format(zoom, len(tiles)))
+    meta = {"min_zoom": min_zoom, "max_zoom": max_zoom,
+            "full_max_zoom": full_max_zoom, "cell_bits": cell_bits,
+            "count": len(lats)}
+    if len(lats):
+        meta["center"] = [float(np.median(lats)), float(np.median(lons))]
+    write_json(os.path.join(out_dir, "meta.json"), meta)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('out_dir', help='Directory for the tile levels.')
+    parser.add_argument('tweet_files', nargs='+',
+                        help='Quake files named mag_lat_lon_date.json')
+    parser.add_argument('--min-zoom', type=int, default=0)
+    parser.add_argument('--max-zoom', type=int, default=12)
+    parser.add_argument('--full-max-zoom', type=int, default=FULL_MAX_ZOOM,
+                        help='Write the levels up to this zoom as one file '
+                        'each rather than a file per tile.')
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments()
+    seen = IdSet()
+    lats = []
+    lons = []
+    for tweet_file in args.tweet_files:
+        quake = quake_from_filename(tweet_file)
+        data = unique_by_id(file_timely_data(tweet_file, quake.date), seen)
+        (file_lats, file_lons) = tweet_coordinates(data)
+        lats += file_lats
+        lons += file_lons
+    logging.info("# geotagged tweets: {0}".format(len(lats)))
+    write_pyramid(lats, lons, args.out_dir, args.min_zoom, args.max_zoom,
+                  full_max_zoom=args.full_max_zoom)
+
+if __name__ == "__main__":
+    main()
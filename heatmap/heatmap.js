@@ -47,9 +47,158 @@ function success(data, textStatus, jqXHR) {
     heatmap.setMap(map)
 }
 
+// Tile pyramid written by geo_tiles.py: meta.json, one <zoom>.json of
+// weighted cells per low zoom level and one <zoom>/<x>/<y>.json per tile of
+// the others.  Only the level for the current zoom is loaded, and of a tiled
+// level only the tiles in view.
+var tileDir;
+var tileMeta;
+var tileLevel = null;
+var tileCells = {};
+var tileHeatmap = null;
+
+function levelForZoom(zoom) {
+    return Math.max(tileMeta.min_zoom, Math.min(tileMeta.max_zoom, zoom));
+}
+
+function tileRange(value, level) {
+    var side = Math.pow(2, level);
+    return Math.max(0, Math.min(side - 1, Math.floor(value * side)));
+}
+
+// "x/y" of the tiles of a level that the map shows
+function visibleTiles(level) {
+    var bounds = map.getBounds();
+    if (!bounds)
+	return []
+    var ne = bounds.getNorthEast(), sw = bounds.getSouthWest();
+    var side = Math.pow(2, level);
+    var mercatorY = function (lat) {
+	var sinLat = Math.sin(Math.max(-85.0511287798,
+				       Math.min(85.0511287798, lat))
+			      * Math.PI / 180);
+	return 0.5 - Math.log((1 + sinLat) / (1 - sinLat)) / (4 * Math.PI);
+    };
+    var west = tileRange((sw.lng() + 180) / 360, level);
+    var east = tileRange((ne.lng() + 180) / 360, level);
+    var top = tileRange(mercatorY(ne.lat()), level);
+    var bottom = tileRange(mercatorY(sw.lat()), level);
+    var columns = [];
+    // a view across the antimeridian wraps around to the first column
+    if (west <= east)
+	for (var x = west; x <= east; x++)
+	    columns.push(x)
+    else
+	for (var x = 0; x < side; x++)
+	    if (x >= west || x <= east)
+		columns.push(x)
+    var tiles = [];
+    for (var i in columns)
+	for (var y = top; y <= bottom; y++)
+	    tiles.push(columns[i] + "/" + y)
+    return tiles
+}
+
+function drawTiles(tiles) {
+    var heatMapData = [];
+    for (var t in tiles) {
+	var cells = tileCells[tiles[t]];
+	for (var i in cells)
+	    heatMapData.push({
+		location: new google.maps.LatLng(cells[i][0], cells[i][1]),
+		weight: cells[i][2]
+	    })
+    }
+    if (tileHeatmap == null) {
+	tileHeatmap = new google.maps.visualization.HeatmapLayer({
+	    data: heatMapData,
+	    radius: 7
+	});
+	tileHeatmap.setMap(map)
+    }
+    else
+	tileHeatmap.setData(heatMapData)
+}
+
+function showTileLevel(data, textStatus, jqXHR) {
+    if (data.zoom != tileLevel)
+	return
+    var tiles = [];
+    for (var tile in data.tiles) {
+	tileCells[tile] = data.tiles[tile]
+	tiles.push(tile)
+    }
+    drawTiles(tiles)
+}
+
+function showTile(data, textStatus, jqXHR) {
+    if (data.zoom != tileLevel)
+	return
+    tileCells[data.tile] = data.cells
+    drawTiles(visibleTiles(tileLevel))
+}
+
+function loadTiles() {
+    var level = levelForZoom(map.getZoom());
+    var full = level <= tileMeta.full_max_zoom;
+    if (level != tileLevel) {
+	tileLevel = level
+	tileCells = {}
+	if (full)
+	    $.ajax({
+		url: tileDir + "/" + level + ".json",
+		dataType:"json",
+		async: true,
+		success: showTileLevel,
+	    });
+    }
+    if (full)
+	return
+    var tiles = visibleTiles(level);
+    for (var t in tiles) {
+	if (tiles[t] in tileCells)
+	    continue
+	// asked for once, a tile without any tweets has no file
+	tileCells[tiles[t]] = []
+	$.ajax({
+	    url: tileDir + "/" + level + "/" + tiles[t] + ".json",
+	    dataType:"json",
+	    async: true,
+	    success: showTile,
+	});
+    }
+    drawTiles(tiles)
+}
+
+function initializeTiles(data, textStatus, jqXHR) {
+    tileMeta = data
+    if ("center" in tileMeta)
+	map.setCenter(new google.maps.LatLng(tileMeta.center[0],
+					     tileMeta.center[1]))
+    google.maps.event.addListener(map, 'zoom_changed', loadTiles);
+    google.maps.event.addListener(map, 'idle', loadTiles);
+    loadTiles()
+}
+
 function initialize() {
     Math.seedrandom('a better seed?')
     var $_GET = getQueryParams(document.location.search);
+    if ("tiles" in $_GET) {
+	tileDir = $_GET["tiles"]
+	map = new google.maps.Map(document.getElementById('map_canvas'), {
+	    center: new google.maps.LatLng(0, 0),
+	    zoom: 7,
+	    zoomControl: true,
+	    mapTypeId: google.maps.MapTypeId.ROADMAP,
+	});
+	$.ajax({
+            url: tileDir + "/meta.json",
+            dataType:"json",
+            async: true,
+	    success: initializeTiles,
+	});
+	return
+    }
     var url = "http://cs.unm.edu/~lnunno/uber-viz/json/fileLoader.php?name="
     var timeOfDay = "day"
     if ("time" in $_GET) {
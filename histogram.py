@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Histograms of tweet times.  Times are epoch seconds in integer arrays and the
+bins are aligned on an origin, usually the earthquake time, so histograms of
+different quakes line up bin for bin.
+"""
+
+from __future__ import print_function
+
+import calendar
+
+import numpy as np
+
+# bin widths in seconds
+MINUTE = 60
+QUARTER_HOUR = 15 * MINUTE
+HOUR = 60 * MINUTE
+
+#   epoch_seconds :: Datetime -> Int
+def epoch_seconds(date_time):
+    """Seconds since the epoch of a naive UTC datetime"""
+    return calendar.timegm(date_time.utctimetuple())
+
+#   bin_edges :: Int -> Int -> Int -> Int -> Array Int
+def bin_edges(low, high, width, origin=0):
+    """
+    Edges origin + k * width of the bins covering [low, high).  There is
+    always at least one bin.
+    """
+    first = origin + ((low - origin) // width) * width
+    last = origin - ((origin - high) // width) * width
+    if last <= first:
+        last = first + width
+    return np.arange(first, last + 1, width, dtype=np.int64)
+
+#   time_histogram :: Array Int -> Int -> Int -> Int -> Int -> (Array Int, Array Int)
+def time_histogram(times, width=QUARTER_HOUR, origin=0, low=None, high=None):
+    """
+    Counts the times in bins [edge, edge + width) aligned on origin.  The
+    bins cover [low, high), by default every time given, and times outside
+    of it are not counted.  Returns the counts and the len(counts) + 1 edges.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    if low is None or high is None:
+        if not len(times):
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        if low is None:
+            low = times.min()
+        if high is None:
+            high = times.max() + 1
+    edges = bin_edges(low, high, width, origin)
+    bins = (times - edges[0]) // width
+    keep = (times >= low) & (times < high)
+    counts = np.bincount(bins[keep], minlength=len(edges) - 1)
+    return (counts[:len(edges) - 1], edges)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Per stage counters and wall times of a run, in total and per input file,
+written out as a JSON report.  The pipeline records into the current Metrics
+through the module functions; worker processes record into their own with
+recording() and send the result back to be merged.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+from contextlib import contextmanager
+
+class Metrics(object):
+    """Counters and stage times, in total and for each file"""
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.stages = {}
+        self.files = {}
+        self.file = None
+
+    def _file(self, filename):
+        if filename not in self.files:
+            self.files[filename] = {"counters": {}, "stages": {}}
+        return self.files[filename]
+
+    #   count :: String -> Int -> ()
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+        if self.file is not None:
+            counters = self._file(self.file)["counters"]
+            counters[name] = counters.get(name, 0) + amount
+
+    #   add_time :: String -> Float -> Int -> ()
+    def add_time(self, name, seconds, calls=1):
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += seconds
+        stage["calls"] += calls
+        if self.file is not None:
+            stages = self._file(self.file)["stages"]
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Times the block as stage name"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    @contextmanager
+    def in_file(self, filename):
+        """Attributes what is recorded in the block to filename as well"""
+        (outer, self.file) = (self.file, filename)
+        try:
+            yield
+        finally:
+            self.file = outer
+
+    #   merge :: Dict -> ()
+    def merge(self, report):
+        """Adds in the as_dict report of another Metrics, like a worker's"""
+        for (name, amount) in report["counters"].iteritems():
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for (name, stage) in report["stages"].iteritems():
+            total = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] += stage["seconds"]
+            total["calls"] += stage["calls"]
+        for (filename, recorded) in report["files"].iteritems():
+            merged = self._file(filename)
+            for kind in ("counters", "stages"):
+                for (name, value) in recorded[kind].iteritems():
+                    merged[kind][name] = merged[kind].get(name, 0) + value
+
+    #   as_dict :: Bool -> Dict
+    def as_dict(self, counters=True):
+        """The report, without any counters when counters is False"""
+        files = self.files
+        if not counters:
+            files = dict((name, {"counters": {}, "stages": recorded["stages"]})
+                         for (name, recorded) in files.iteritems())
+        return {"started": time.strftime("%Y-%m-%d %H:%M:%S",
+                                         time.localtime(self.started)),
+                "wall_seconds": time.time() - self.started,
+                "counters": self.counters if counters else {},
+                "stages": self.stages, "files": files}
+
+    #   save :: Filename -> IO ()
+    def save(self, filename):
+        with open(filename + ".tmp", "w") as report:
+            json.dump(self.as_dict(), report, indent=1, sort_keys=True)
+        os.rename(filename + ".tmp", filename)
+
+_current = Metrics()
+
+#   current :: () -> Metrics
+def current():
+    return _current
+
+#   count :: String -> Int -> IO ()
+def count(name, amount=1):
+    _current.count(name, amount)
+
+#   stage :: String -> ContextManager
+def stage(name):
+    return _current.stage(name)
+
+#   in_file :: Filename -> ContextManager
+def in_file(filename):
+    return _current.in_file(filename)
+
+@contextmanager
+def recording():
+    """Records the block into a fresh Metrics, which it yields"""
+    global _current
+    (outer, _current) = (_current, Metrics())
+    try:
+        yield _current
+    finally:
+        _current = outer
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+A store of per file results keyed by the content of the files.  The
+manifest remembers the size, mtime and sha1 of every file seen, so a file is
+only hashed again when it changed, and each result is a json file named by
+a key made of the sha1, the file's name and a version, so a file that is
+renamed (its name holds the quake) or a new version of the computation
+never reads an old result.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import json
+import hashlib
+
+MANIFEST = "manifest.json"
+HASH_CHUNK = 1 << 20
+
+#   file_digest :: Filename -> IO String
+def file_digest(filename):
+    """The sha1 of the bytes of a file, as hex"""
+    digest = hashlib.sha1()
+    with open(filename, "rb") as data:
+        for chunk in iter(lambda: data.read(HASH_CHUNK), ""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+#   digest_of :: [String] -> String
+def digest_of(parts):
+    """The sha1 of some strings, as hex"""
+    return hashlib.sha1("\0".join(parts)).hexdigest()
+
+class PartialStore(object):
+    """The results of path, with the manifest of the files they are from"""
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self.files = {}
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        manifest = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, "r") as manifest_file:
+                self.files = json.load(manifest_file)
+
+    #   key :: Filename -> IO String
+    def key(self, filename):
+        """The key of the results of a file as it is now"""
+        stat = os.stat(filename)
+        name = os.path.abspath(filename)
+        entry = self.files.get(name)
+        if entry is None or entry["size"] != stat.st_size or \
+           entry["mtime"] != stat.st_mtime:
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime,
+                     "sha1": file_digest(filename)}
+            self.files[name] = entry
+        return digest_of([str(self.version), os.path.basename(filename),
+                          entry["sha1"]])
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    #   get :: String -> IO Maybe Dict
+    def get(self, key):
+        if not os.path.exists(self._file(key)):
+            return None
+        with open(self._file(key), "r") as result:
+            return json.load(result)
+
+    #   put :: String -> Dict -> IO ()
+    def put(self, key, value):
+        with open(self._file(key) + ".tmp", "w") as result:
+            json.dump(value, result)
+        os.rename(self._file(key) + ".tmp", self._file(key))
+
+    #   save :: () -> IO ()
+    def save(self):
+        """Writes the manifest"""
+        manifest = os.path.join(self.path, MANIFEST)
+        with open(manifest + ".tmp", "w") as manifest_file:
+            json.dump(self.files, manifest_file, indent=1, sort_keys=True)
+        os.rename(manifest + ".tmp", manifest)
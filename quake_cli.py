@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+One command line for the quake tweet tools:
+
+    window     the timely tweets of quake files, as JSON lines
+    split      the quake files of a whole catalog, from one tweet capture
+    wordcount  word counts of quake files (rest_data_process)
+    histogram  tweets per time bin charts of quake files
+    geo        the geotagged tweets of a quake file for the heatmap
+    stats      geotagged and total tweet counts of tweet files
+    matrix     tweets per bin after each quake, one row per quake, queried
+
+Each subcommand imports only what it needs, so the small ones start without
+loading matplotlib or nltk, and charts are drawn headless.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+# charts never need a display
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+#   run_window :: Namespace -> IO ()
+def run_window(args):
+    from rest_data_process import file_timely_data, quake_from_filename
+    from dedup import IdSet, unique_by_id
+    seen = IdSet()
+    for tweet_file in args.tweet_files:
+        quake = quake_from_filename(tweet_file)
+        data = file_timely_data(tweet_file, quake.date, args.source)
+        if args.unique:
+            data = unique_by_id(data, seen)
+        for tweet in data:
+            print(json.dumps(tweet))
+
+#   run_split :: Namespace -> IO ()
+def run_split(args):
+    from window_split import main_split
+    main_split(args)
+
+#   run_wordcount :: Namespace -> IO ()
+def run_wordcount(args):
+    from rest_data_process import main_wordcount
+    main_wordcount(args)
+
+#   render_chart :: (Filename, Source, String) -> IO Maybe Filename
+def render_chart((tweet_file, source, out_dir)):
+    """Draws the chart of one quake file, returning its png, if it has tweets"""
+    from rest_data_process import file_timely_data, quake_from_filename, \
+        remove_retweets, graph_tweets, displayname_from_filename, \
+        replace_extension
+    from histogram import epoch_seconds
+    quake = quake_from_filename(tweet_file)
+    tweets = remove_retweets(file_timely_data(tweet_file, quake.date, source))
+    if not tweets:
+        return None
+    png = replace_extension(tweet_file, "png")
+    if out_dir:
+        png = os.path.join(out_dir, os.path.basename(png))
+    graph_tweets(tweets, png, displayname_from_filename(tweet_file),
+                 epoch_seconds(quake.date))
+    return png
+
+#   run_histogram :: Namespace -> IO ()
+def run_histogram(args):
+    jobs = [(x, args.source, args.out_dir) for x in args.tweet_files]
+    if args.workers > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.workers)
+        try:
+            pngs = pool.map(render_chart, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        pngs = map(render_chart, jobs)
+    for png in pngs:
+        if png is not None:
+            print(png)
+
+#   run_geo :: Namespace -> IO ()
+def run_geo(args):
+    from rest_data_process import print_geo
+    print_geo(args.tweet_file, args.source)
+
+#   run_stats :: Namespace -> IO ()
+def run_stats(args):
+    from stream_print import all_file_stats
+    stats = all_file_stats(args.tweet_files, args.fast, args.workers)
+    for (tweet_file, (geo, count, _)) in zip(args.tweet_files, stats):
+        print("{0}\t{1}\t{2}".format(tweet_file, geo, count))
+
+#   run_matrix :: Namespace -> IO ()
+def run_matrix(args):
+    from event_matrix import main_matrix
+    main_matrix(args)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__ or "",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+
+    window = commands.add_parser('window', help='Timely tweets as JSON lines.')
+    window.add_argument('tweet_files', nargs='+',
+                        help='Quake files named mag_lat_lon_date.json')
+    window.add_argument('-u', '--unique', action='store_true',
+                        help='Print a tweet found in several files once.')
+    window.set_defaults(run=run_window)
+
+    split = commands.add_parser('split', help='Quake files of a catalog.')
+    split.set_defaults(run=run_split)
+
+    wordcount = commands.add_parser('wordcount', help='Word counts.')
+    wordcount.set_defaults(run=run_wordcount)
+
+    histogram = commands.add_parser('histogram', help='Tweet rate charts.')
+    histogram.add_argument('tweet_files', nargs='+',
+                           help='Quake files named mag_lat_lon_date.json')
+    histogram.add_argument('-w', '--workers', type=int, default=1,
+                           help='Processes drawing charts at once.')
+    histogram.add_argument('-o', '--out-dir',
+                           help='Directory for the charts, else next to the '
+                           'quake files.')
+    histogram.set_defaults(run=run_histogram)
+
+    geo = commands.add_parser('geo', help='Geotagged tweets for the heatmap.')
+    geo.add_argument('tweet_file', help='Quake file named mag_lat_lon_date.json')
+    geo.set_defaults(run=run_geo)
+
+    stats = commands.add_parser('stats', help='Geotagged and total counts.')
+    stats.add_argument('tweet_files', nargs='+', help='Tweet files.')
+    stats.set_defaults(run=run_stats)
+
+    matrix = commands.add_parser('matrix', help='Aligned quake activity.')
+    matrix.set_defaults(run=run_matrix)
+
+    # the arguments shared with rest_data_process are only added to the
+    # subcommand being run, so the others do not import it
+    argv = sys.argv[1:] if argv is None else argv
+    command = next((x for x in argv if not x.startswith('-')), None)
+    if command in ('window', 'histogram', 'geo'):
+        from rest_data_process import add_source_arguments
+        add_source_arguments(commands.choices[command])
+    elif command == 'stats':
+        from stream_print import add_stats_arguments
+        add_stats_arguments(stats)
+    elif command == 'split':
+        from window_split import add_split_arguments
+        add_split_arguments(split)
+    elif command == 'wordcount':
+        from rest_data_process import add_wordcount_arguments
+        add_wordcount_arguments(wordcount)
+    elif command == 'matrix':
+        from event_matrix import add_matrix_arguments
+        add_matrix_arguments(matrix)
+    return parser.parse_args(argv)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
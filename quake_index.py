@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Spatial and temporal index over catalog quakes for assigning geotagged tweets
+to the nearest quake.  Every quake is filed under the (hour, lat cell, lon
+cell) buckets its tweet window and search radius cover, so each tweet only
+looks at the quakes of its own bucket, and the distances of a batch of
+tweets are resolved with a vectorized haversine per bucket.
+"""
+
+from __future__ import print_function
+
+import math
+
+import numpy as np
+
+from rest_data_process import WINDOW_BEFORE, WINDOW_AFTER
+from rest_search import SEARCH_RADIUS_KM
+from histogram import epoch_seconds, HOUR
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = 5.0
+NO_QUAKE = -1
+
+#   haversine :: Array Float -> Array Float -> Array Float -> Array Float
+#                -> Array Float
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in km, broadcast over the arguments"""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    sin_dlat = np.sin((lat2 - lat1) / 2)
+    sin_dlon = np.sin(np.radians(np.subtract(lon2, lon1)) / 2)
+    a = sin_dlat ** 2 + np.cos(lat1) * np.cos(lat2) * sin_dlon ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class QuakeIndex(object):
+    """
+    The quakes of a catalog, bucketed so that nearest finds, for each tweet,
+    the closest quake within radius km whose window holds the tweet.
+    """
+    def __init__(self, quakes, radius=SEARCH_RADIUS_KM,
+                 cell_degrees=CELL_DEGREES):
+        self.quakes = list(quakes)
+        self.radius = radius
+        self.cell_degrees = cell_degrees
+        self.lon_cells = int(math.ceil(360 / cell_degrees))
+        self.lats = np.array([x.lat for x in self.quakes], dtype=np.float64)
+        self.lons = np.array([x.lon for x in self.quakes], dtype=np.float64)
+        self.times = np.array([epoch_seconds(x.date) for x in self.quakes],
+                              dtype=np.int64)
+        self.buckets = {}
+        for number in range(len(self.quakes)):
+            for key in self._quake_keys(number):
+                self.buckets.setdefault(key, []).append(number)
+        self.buckets = dict((key, np.array(numbers, dtype=np.int64))
+                            for (key, numbers) in self.buckets.iteritems())
+
+    def __len__(self):
+        return len(self.quakes)
+
+    #   _quake_keys :: Int -> [(Int, Int, Int)]
+    def _quake_keys(self, number):
+        """The buckets of the tweets that may belong to quake number"""
+        lat = self.lats[number]
+        lon = self.lons[number]
+        time = self.times[number]
+        reach = self.radius / KM_PER_DEGREE
+        lat_low = max(-90.0, lat - reach)
+        lat_high = min(90.0, lat + reach)
+        # widest longitude span of the circle around the epicenter
+        sin_reach = math.sin(math.radians(reach))
+        if sin_reach >= math.cos(math.radians(lat)):
+            lon_keys = range(self.lon_cells)
+        else:
+            lon_reach = math.degrees(math.asin(sin_reach /
+                                               math.cos(math.radians(lat))))
+            first = int(math.floor((lon - lon_reach + 180) / self.cell_degrees))
+            last = int(math.floor((lon + lon_reach + 180) / self.cell_degrees))
+            # wraps around the antimeridian
+            lon_keys = set(x % self.lon_cells for x in range(first, last + 1))
+        lat_keys = range(self._lat_cell(lat_low), self._lat_cell(lat_high) + 1)
+        first = int(time - WINDOW_BEFORE.total_seconds()) // HOUR
+        last = int(time + WINDOW_AFTER.total_seconds()) // HOUR
+        return [(hour, lat_key, lon_key)
+                for hour in range(first, last + 1)
+                for lat_key in lat_keys
+                for lon_key in lon_keys]
+
+    def _lat_cell(self, lat):
+        return int(math.floor((lat + 90) / self.cell_degrees))
+
+    #   nearest :: Array Float -> Array Float -> Array Int
+    #              -> (Array Int, Array Float)
+    def nearest(self, lats, lons, times):
+        """
+        For tweets at lats/lons created at times (epoch seconds), the number
+        of the nearest quake in self.quakes and its distance in km, or
+        NO_QUAKE and inf when no quake is near and timely.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        times = np.asarray(times, dtype=np.int64)
+        found = np.full(len(lats), NO_QUAKE, dtype=np.int64)
+        distances = np.full(len(lats), np.inf)
+        if not len(lats) or not self.buckets:
+            return (found, distances)
+        hours = times // HOUR
+        lat_keys = np.floor((lats + 90) / self.cell_degrees).astype(np.int64)
+        lon_keys = np.floor((lons + 180) / self.cell_degrees).astype(np.int64) \
+            % self.lon_cells
+        keys = np.stack([hours, lat_keys, lon_keys], axis=1)
+        (unique_keys, inverse) = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse, kind="mergesort")
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_keys) + 1))
+        for (group, key) in enumerate(unique_keys):
+            numbers = self.buckets.get(tuple(int(x) for x in key))
+            if numbers is None:
+                continue
+            tweets = order[bounds[group]:bounds[group + 1]]
+            # tweets down, quakes across
+            km = haversine(lats[tweets, None], lons[tweets, None],
+                           self.lats[numbers], self.lons[numbers])
+            lag = times[tweets, None] - self.times[numbers]
+            km[(km > self.radius) |
+               (lag < -WINDOW_BEFORE.total_seconds()) |
+               (lag > WINDOW_AFTER.total_seconds())] = np.inf
+            best = np.argmin(km, axis=1)
+            best_km = km[np.arange(len(tweets)), best]
+            near = np.isfinite(best_km)
+            found[tweets[near]] = numbers[best[near]]
+            distances[tweets[near]] = best_km[near]
+        return (found, distances)
+
+    #   nearest_quake :: Float -> Float -> Datetime -> Maybe Quake
+    def nearest_quake(self, lat, lon, date):
+        """The nearest quake to one tweet, or None"""
+        (found, _) = self.nearest([lat], [lon], [epoch_seconds(date)])
+        if found[0] == NO_QUAKE:
+            return None
+        return self.quakes[found[0]]
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Thread safe token bucket for request budgets like twitter's 180 searches per
+15 minutes.
+"""
+
+from __future__ import print_function
+
+import time
+import threading
+
+class TokenBucket(object):
+    """
+    Budget of capacity requests per period seconds, refilled continuously.
+    The server's own count of remaining requests can be folded in with sync,
+    so the bucket never believes in more requests than the server allows.
+    """
+    def __init__(self, capacity=180, period=15 * 60, clock=time.time,
+                 sleep=time.sleep):
+        self.capacity = capacity
+        self.rate = capacity / float(period)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    #   wait_time :: () -> Float
+    def wait_time(self):
+        """Seconds until a request may be made"""
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    #   try_acquire :: () -> Bool
+    def try_acquire(self):
+        """Takes a token if there is one"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    #   acquire :: () -> IO ()
+    def acquire(self):
+        """Takes a token, sleeping until there is one"""
+        while not self.try_acquire():
+            self.sleep(self.wait_time())
+
+    #   sync :: Int -> Float -> IO ()
+    def sync(self, remaining, reset=None):
+        """
+        Caps the budget at the remaining requests the server reported.  With
+        none remaining, no token is available until the reset epoch time.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset is not None:
+                self.tokens = min(self.tokens,
+                                  1 - (reset - self.updated) * self.rate)
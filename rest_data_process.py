@@ -10,56 +10,150 @@ from __future__ import print_function
 import sys
 import json
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
 import os.path
 import os
 
-from collections import namedtuple
-
-from nltk import PorterStemmer
-from nltk.corpus import stopwords
+from collections import namedtuple, OrderedDict
 
 import logging
 import re
-
-# 2014-11-20 06:26:49 UTC
-INPUT_FORMAT = "%Y-%m-%d_%H:%M:%S"
-#"Wed Nov 19 23:15:11 +0000 2014"
-TWEET_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+import argparse
+import functools
+import multiprocessing
+import cProfile
+import pstats
+
+from histogram import time_histogram, epoch_seconds, MINUTE, QUARTER_HOUR
+from dedup import IdSet, unique_by_id
+from tweet_cache import load_columns, TweetColumns, created_epoch
+from tweet_index import window_lines
+import metrics
+from partials import PartialStore, digest_of
+from tweet_io import open_tweet_file, strip_compression
+from tweet_record import StringArena, compact_tweet, column_record, \
+    tweet_epoch
+from sketch import WordSketch, save_sketches, WIDTH, DEPTH, CAPACITY
+from tweet_time import INPUT_FORMAT, TWEET_FORMAT, parse_created_at, \
+    parse_quake_date, snowflake_epoch, CREATED_AT_LENGTH
+
+# window kept around an earthquake time
+WINDOW_BEFORE = timedelta(hours=2)
+WINDOW_AFTER = timedelta(hours=4)
+# where file_timely_data reads a tweet file from
+READ_RAW = "raw"
+READ_CACHE = "cache"
+READ_INDEX = "index"
+# version of the stored partials, bumped whenever what a quake file's
+# partial holds or how it is counted changes
+PARTIALS_VERSION = 2
+# every created_at in a raw tweet line, including the nested user and
+# retweeted_status ones
+CREATED_AT_RE = re.compile(r'"created_at":\s*"([^"]+)"')
+# every id in a raw tweet line, to time a tweet without a usable created_at
+ID_RE = re.compile(r'"id":\s*(\d+)')
 '''--------------------------------------------------------------------------'''
 '''WordCount'''
 '''--------------------------------------------------------------------------'''
+EXTRA_WORDS = frozenset(["earthquake", "earthquak", "magnitude", "magnitud",
+                         "magnitudemb", "epicent", "epicenter", "novemb",
+                         "depth", "california", "quake", "quak", "sismo",
+                         "dyfi", "oklahoma", "northern", "carlsberg",
+                         "temblor", "indonesia", "kansa", "depthkm", "oregon",
+                         "alaska", "hawaii", "itim", "wichita"])
+ALLOWABLE_CHARS = "abcdefghijklmnopqrstuvwxyz"
+# everything else, deleted with str.translate
+DISALLOWED_CHARS = "".join(chr(x) for x in range(256)
+                           if chr(x) not in ALLOWABLE_CHARS)
+
+class LRUCache(object):
+    """Mapping of at most size keys that drops the least recently used"""
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def put(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        if len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+class EnglishTokenizer(object):
+    """
+    Stems english words for wordcount.  The stemmer and stopwords are loaded
+    once and the stem of every raw token is kept in a bounded LRU cache, since
+    tweets about a quake repeat a small vocabulary.
+    """
+    def __init__(self, cache_size=100000):
+        # nltk takes a second to import, only pay for it when stemming
+        from nltk import PorterStemmer
+        from nltk.corpus import stopwords
+        self.stemmer = PorterStemmer()
+        self.stopwords = frozenset(stopwords.words('english'))
+        self.cache = LRUCache(cache_size)
+
+    #   transform :: String -> String
+    def transform(self, word):
+        stemmed = self.cache.get(word)
+        if stemmed is None:
+            stemmed = self._transform(word)
+            self.cache.put(word, stemmed)
+        return stemmed
+
+    def _transform(self, word):
+        metrics.count("tokens_stemmed")
+        word = word.encode('ascii', 'ignore')
+        lowercase = word.lower().translate(None, DISALLOWED_CHARS)
+        stemmed = self.stemmer.stem(lowercase)
+        if lowercase in self.stopwords or stemmed in self.stopwords or \
+           stemmed in EXTRA_WORDS or lowercase in EXTRA_WORDS or \
+           len(stemmed) <= 3:
+            return ""
+        else:
+            return stemmed
+
+    #   tokenize :: String -> [String]
+    def tokenize(self, text):
+        """All the kept stems of a tweet's text"""
+        transform = self.transform
+        return [x for x in map(transform, text.split(' ')) if len(x)]
+
+_english_tokenizer = None
+#   english_tokenizer :: () -> EnglishTokenizer
+def english_tokenizer():
+    """The shared tokenizer, created on first use"""
+    global _english_tokenizer
+    if _english_tokenizer is None:
+        _english_tokenizer = EnglishTokenizer()
+    return _english_tokenizer
+
 #   english_transform :: String -> String
 def english_transform(word):
-    word = word.encode('ascii', 'ignore')
-    allowable_chars = "abcdefghijklmnopqrstuvwxyz"
-    lowercase = "".join(char for char in word.lower()
-                        if char in allowable_chars)
-    extra_words = ["earthquake", "earthquak", "magnitude", "magnitud",
-                   "magnitudemb", "epicent", "epicenter", "novemb", "depth",
-                   "california", "quake", "quak", "sismo", "dyfi",
-                   "oklahoma", "northern", "carlsberg", "temblor", "indonesia",
-                   "kansa", "depthkm", "oregon", "alaska", "hawaii", "itim", "wichita"]
-    
-    stemmer = PorterStemmer()
-    stemmed = stemmer.stem(lowercase)
-    if lowercase in stopwords.words('english') or \
-       stemmed in stopwords.words('english') or \
-       stemmed in extra_words or lowercase in extra_words or \
-       len(stemmed) <= 3:
-        return ""
-    else:
-        return stemmed
+    return english_tokenizer().transform(word)
+
+#   lowercase_tokenize :: String -> [String]
+def lowercase_tokenize(text):
+    return [x for x in text.lower().split(' ') if len(x)]
 
-#   wordcount :: [Dict] -> (String -> String) -> {String:Int}
-def wordcount(tweets, word_transform):
+#   wordcount :: [Dict] -> (String -> [String]) -> {String:Int}
+def wordcount(tweets, tokenize):
     words = {}
     for tweet in tweets:
         if "text" in tweet:
             text = tweet["text"]
         else:
             continue
-        for word in (x for x in map(word_transform, text.split(' ')) if len(x)):
+        for word in tokenize(text):
             if word in words:
                 words[word] += 1
             else:
@@ -81,35 +175,49 @@ def split_tweets_by_lang(tweets):
 
     return langs
 
-#   wordcounts_by_lang :: [Dict] -> {Lang:{Word:Count}}
-def wordcounts_by_lang(tweets):
+#   wordcounts_by_lang :: [Dict] -> EnglishTokenizer -> {Lang:{Word:Count}}
+def wordcounts_by_lang(tweets, tokenizer=None):
+    if tokenizer is None:
+        tokenizer = english_tokenizer()
     wordcounts = {}
     tweets_by_lang = split_tweets_by_lang(tweets)
     for lang, tweets in tweets_by_lang.iteritems():
         if lang == "en":
             logging.info("# english tweets: {0}".format(len(tweets)))
-            wordcounts[lang] = wordcount(tweets, english_transform)
+            wordcounts[lang] = wordcount(tweets, tokenizer.tokenize)
         else:
-            wordcounts[lang] = wordcount(tweets, lambda x: x.lower())
+            wordcounts[lang] = wordcount(tweets, lowercase_tokenize)
     return wordcounts
 
 Quake = namedtuple("Quake", ['mag', 'lat', 'lon', 'date'])
+#   split_quake_extension :: Filename -> (String, String)
+def split_quake_extension(filename):
+    """
+    splitext of a quake file without its compression suffix, so
+    "x.txt.gz" is ("x", ".txt").  The dots of the lat and lon of a quake
+    file without an extension are not taken for one.
+    """
+    (root, extension) = os.path.splitext(strip_compression(filename))
+    if not extension[1:].isalnum():
+        return (root + extension, "")
+    return (root, extension)
+
 #   quake_from_filename :: Filename -> Quake
 def quake_from_filename(filename):
     base = os.path.basename(filename)
-    (root, _) = os.path.splitext(base)
+    (root, _) = split_quake_extension(base)
     info = root.split("_", 3)
     mag = float(info[0])
     lat = float(info[1])
     lon = float(info[2])
-    date = datetime.strptime(info[3], INPUT_FORMAT)
+    date = parse_quake_date(info[3])
     return Quake(mag=mag, lat=lat, lon=lon, date=date)
 
 
 
 def displayname_from_filename(filename):
     base = os.path.basename(filename)
-    (root, _) = os.path.splitext(base)
+    (root, _) = split_quake_extension(base)
     values = root.split("_")
     mag = values[0]
     lat = values[1]
@@ -121,136 +229,232 @@ def displayname_from_filename(filename):
 
     
 def replace_extension(filename, extension):
-    (root, _) = os.path.splitext(filename)
+    (root, _) = split_quake_extension(filename)
     return root + "." + extension
 
 '''--------------------------------------------------------------------------'''
 '''Graph'''
 '''--------------------------------------------------------------------------'''
-#   datetime_ceil_by_hour :: Datetime -> Datetime
-def datetime_ceil_by_hour(date_time):
-    if date_time.minute or date_time.second or date_time.microsecond:
-        return date_time.replace(second=0, microsecond=0) + timedelta(hours=1)
-    else:
-        return date_time
-
-#   datetime_interval_by_hours :: Datetime -> Datetime -> Timedelta -> [(Datetime, Datetime)]
-def datetime_buckets(low, high, interval):
-    assert low < high
-    dates = [low]
-    curr_date = low
-    while curr_date + interval < high:
-        curr_date += interval
-        dates.append(curr_date)
-    return zip(dates[:-1], dates[1:])
-
-def in_bucket(value, (low, high)):
-    return low <= value < high
-
-#   num_dates_in_buckets :: [Dict] -> [(Datetime, Datetime)] -> [Int]
-def num_dates_in_buckets(dates, buckets):
-    assert len(buckets) > 1
-    #dates = sorted((datetime.strptime(x["created_at"], TWEET_FORMAT)
-    #                for x in tweets))
-    curr_bucket = 0
-    count = 0
-    counts = []
-    date = 0
-    while date < len(dates) and curr_bucket < len(buckets):
-        if in_bucket(dates[date], buckets[curr_bucket]):
-            count += 1
-            date += 1
-        else:
-            counts.append(count)
-            count = 0
-            curr_bucket += 1
-
-    return counts
-
-def graph_tweets(tweets, filename, title=None):
-    if not title:
-        title = filename
-    dates = sorted((datetime.strptime(x["created_at"], TWEET_FORMAT)
-                    for x in tweets))
-    low = min(dates).replace(second=0, microsecond=0)
-    high = datetime_ceil_by_hour(max(dates))
-    buckets = datetime_buckets(low, high, timedelta(minutes=15))
-    count_per_bucket = num_dates_in_buckets(dates, buckets)
+#   tweet_histogram :: [Dict] -> Int -> Int -> (Array Int, Array Int)
+def tweet_histogram(tweets, origin=None, width=QUARTER_HOUR):
+    """
+    The tweets per time bin and the bin edges.  The bins are aligned on
+    origin (epoch seconds, e.g. the quake time), by default on the minute of
+    the first tweet.
+    """
+    times = [tweet_epoch(x) for x in tweets]
+    if origin is None:
+        origin = min(times) // MINUTE * MINUTE
+    return time_histogram(times, width, origin)
+
+#   draw_histogram :: [Int] -> [Int] -> Filename -> String -> IO ()
+def draw_histogram(count_per_bucket, edges, filename, title):
+    """Bar chart of a tweet_histogram"""
+    # a figure of its own on the headless Agg canvas rather than pyplot's
+    # global one, so charts can be drawn in parallel
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
     # graph it. # is y axis, buckets are x axis, count_per bucket is the bar
-    plt.clf()
-    plt.bar(range(len(count_per_bucket)), count_per_bucket,
-            color='r', label='# of tweets')
-    plt.title(title)
-    plt.xlabel("Time Intervals")
-    plt.ylabel("Count of Tweets")
-    plt.xticks(range(len(buckets)),
-               ["{0}:{1:02}".format(x.hour, x.minute) for (x, _) in buckets],
-               rotation='vertical')
-    #plt.show()
-    plt.savefig(filename, bbox_inches='tight')
+    axes.bar(range(len(count_per_bucket)), count_per_bucket,
+             color='r', label='# of tweets')
+    axes.set_title(title)
+    axes.set_xlabel("Time Intervals")
+    axes.set_ylabel("Count of Tweets")
+    starts = (datetime.utcfromtimestamp(x) for x in edges[:-1])
+    axes.set_xticks(range(len(count_per_bucket)))
+    axes.set_xticklabels(["{0}:{1:02}".format(x.hour, x.minute)
+                          for x in starts], rotation='vertical')
+    figure.savefig(filename, bbox_inches='tight')
+
+#   graph_tweets :: [Dict] -> Filename -> String -> Int -> Int -> IO ()
+def graph_tweets(tweets, filename, title=None, origin=None, width=QUARTER_HOUR):
+    """Bar chart of the tweets per time bin, see tweet_histogram"""
+    (count_per_bucket, edges) = tweet_histogram(tweets, origin, width)
+    draw_histogram(count_per_bucket, edges, filename, title or filename)
 
 '''--------------------------------------------------------------------------'''
 ''' Relevant Tweets '''
 '''--------------------------------------------------------------------------'''
 
 def remove_retweets(tweets):
-    return [x for x in tweets if "retweeted_status" not in x]
+    kept = [x for x in tweets if "retweeted_status" not in x]
+    metrics.count("retweets_removed", len(tweets) - len(kept))
+    return kept
 
 #   unique_tweets :: [Dict] -> [Dict]
 def unique_tweets(tweets):
-    """Removes retweets and keeps only unique id tweets"""
-    sorted_by_id = sorted((x for x in tweets if "id" in x),
-                          cmp=lambda x, y: cmp(x["id"], y["id"]))
-    uniques = []
-    prev_tweet = None
-    for tweet in sorted_by_id:
-        if prev_tweet == None or prev_tweet["id"] != tweet["id"]:
-            uniques.append(tweet)
-        prev_tweet = tweet
-
-    return uniques
+    """Keeps the first tweet of each id, in their original order"""
+    return list(unique_by_id(tweets))
 
 #   date_timely :: Datetime -> Datetime -> Bool
 def date_timely(time1, time2):
     """
     Returns whether time1 is in a predifined interval around time2
     """
-    before = timedelta(hours=2)
-    after = timedelta(hours=4)
-    return time2 - before <= time1 <= time2 + after
+    return time2 - WINDOW_BEFORE <= time1 <= time2 + WINDOW_AFTER
+
+#   window_seconds :: Datetime -> (Int, Int)
+def window_seconds(time):
+    """The interval around time, as first and last epoch seconds"""
+    return (epoch_seconds(time - WINDOW_BEFORE),
+            epoch_seconds(time + WINDOW_AFTER))
 
 #   tweet_timely :: Dict -> Datetime -> Bool
 def tweet_timely(tweet, time):
     """
     Returns whether the tweet is in a predifined interval around time.
     """
-    if "created_at" not in tweet:
-        return False
-    else:
+    (low, high) = window_seconds(time)
+    return low <= created_epoch(tweet) <= high
+
+#   timely_line_filter :: Datetime -> (String -> Bool)
+def timely_line_filter(time):
+    """
+    Returns a cheap test on a raw tweet line that rejects lines whose tweet
+    cannot be in the interval around time, without decoding the json.
+
+    The line is kept if any created_at in it is timely, so a nested
+    user/retweeted_status date can only let a line through, never drop it.
+    tweet_timely still makes the final decision on the decoded tweet.  A line
+    without any well formed created_at is kept if any of its ids is timely,
+    as created_epoch times such a tweet by its id; a tweet missing only its
+    own created_at among its nested ones is not.
+    """
+    # "Nov 19" and "2014" of each day touched by the window, so most dates,
+    # like the users' creation dates, are rejected before being parsed
+    days = set()
+    day = (time - WINDOW_BEFORE).date()
+    while day <= (time + WINDOW_AFTER).date():
+        days.add((day.strftime("%b %d"), day.strftime("%Y")))
+        day += timedelta(days=1)
+    (low, high) = window_seconds(time)
+
+    def maybe_timely(line):
+        dates = set(CREATED_AT_RE.findall(line))
+        for created_at in dates:
+            if (created_at[4:10], created_at[-4:]) not in days:
+                continue
+            try:
+                created = parse_created_at(created_at)
+            except ValueError:
+                continue
+            if low <= created <= high:
+                return True
+        if usable_dates(dates):
+            return False
+        return any(low <= x <= high for x in line_id_times(line))
+    return maybe_timely
+
+#   usable_dates :: Set String -> Bool
+def usable_dates(dates):
+    """
+    Whether the created_at of a raw tweet line are all well formed, else its
+    tweet may be timed by its id (see created_epoch) and the ids of the
+    line are looked at.  Only the length is checked, like the days of the
+    line filters.
+    """
+    return bool(dates) and all(len(x) == CREATED_AT_LENGTH for x in dates)
+
+#   line_id_times :: String -> Iterator Int
+def line_id_times(line):
+    """Epoch seconds of the snowflake ids of a raw tweet line"""
+    for tweet_id in ID_RE.findall(line):
         try:
-            created_at = datetime.strptime(tweet["created_at"], TWEET_FORMAT)
-            return date_timely(created_at, time)
+            yield snowflake_epoch(tweet_id)
         except ValueError:
-            return False
+            continue
 
-#   timely_data :: File -> Datetime -> IO ([Dict])
-def timely_data(file_obj, earthquake_time):
+#   timely_data :: File -> Datetime -> Bool -> Bool -> IO ([Tweet])
+def timely_data(file_obj, earthquake_time, prefilter=True, compact=False):
     """
-    Looks in the file object for data around the earthquake_time.
+    Looks in the file object for data around the earthquake_time.  With
+    prefilter, lines are screened on their raw created_at fields and only
+    the ones that may be timely are decoded.  With compact, the tweets are
+    kept as TweetRecords sharing one string arena instead of full dicts,
+    each with the created_at parsed here.
     """
     data = []
+    arena = StringArena()
+    maybe_timely = timely_line_filter(earthquake_time)
+    (low, high) = window_seconds(earthquake_time)
+    lines = 0
+    size = 0
+    errors = 0
+    rejects = 0
     for line in file_obj:
+        lines += 1
+        size += len(line)
         line = line.strip()
         if len(line):
+            if prefilter and not maybe_timely(line):
+                rejects += 1
+                continue
             try:
                 tweet = json.loads(line)
             except ValueError:
-                logging.info("ValueError")
+                errors += 1
                 continue
-            if tweet_timely(tweet, earthquake_time):
-                data.append(tweet)
+            created = created_epoch(tweet)
+            if low <= created <= high:
+                data.append(compact_tweet(tweet, arena, created) if compact
+                            else tweet)
+            else:
+                rejects += 1
+    unique = list(unique_by_id(data))
+    metrics.count("lines_read", lines)
+    metrics.count("bytes_read", size)
+    metrics.count("json_errors", errors)
+    metrics.count("window_rejects", rejects)
+    metrics.count("duplicates_dropped", len(data) - len(unique))
+    if errors:
+        logging.info("{0} lines that are not json".format(errors))
+    return unique
+
+#   cached_timely_data :: Filename -> Datetime -> Bool -> IO ([Tweet])
+def cached_timely_data(filename, earthquake_time, compact=False):
+    """
+    timely_data of a tweet file read from its columnar sidecar, which is
+    built on first use.  Only the timely rows are turned into tweet dicts,
+    or into TweetRecords reading their text from the sidecar.
+    """
+    row_tweet = column_record if compact else TweetColumns.tweet
+    columns = load_columns(filename)
+    rows = columns.rows_between(*window_seconds(earthquake_time))
+    unique = list(unique_by_id(row_tweet(columns, x) for x in rows))
+    metrics.count("rows_read", len(rows))
+    metrics.count("duplicates_dropped", len(rows) - len(unique))
+    return unique
+
+#   indexed_timely_data :: Filename -> Datetime -> Bool -> IO ([Tweet])
+def indexed_timely_data(filename, earthquake_time, compact=False):
+    """
+    timely_data of a tweet file that only reads the lines its time index
+    (built on first use) puts in the window.
+    """
+    lines = window_lines(filename, *window_seconds(earthquake_time))
+    return timely_data(lines, earthquake_time, prefilter=False,
+                       compact=compact)
 
-    return unique_tweets(data)
+#   file_timely_data :: Filename -> Datetime -> Source -> Bool -> IO ([Tweet])
+def file_timely_data(filename, earthquake_time, source=READ_RAW,
+                     compact=False):
+    """
+    timely_data of a tweet file, read in full (READ_RAW), through its
+    columnar sidecar (READ_CACHE) or through its time index (READ_INDEX).
+    """
+    readers = {READ_CACHE: cached_timely_data, READ_INDEX: indexed_timely_data}
+    with metrics.stage("read"):
+        if source in readers:
+            try:
+                return readers[source](filename, earthquake_time, compact)
+            except (IOError, OSError) as err:
+                logging.info("no {0} for {1}: {2}".format(source, filename,
+                                                          err))
+        with open_tweet_file(filename) as fileobj:
+            return timely_data(fileobj, earthquake_time, compact=compact)
 
 def geo_count(tweets):
     count = 0
@@ -260,62 +464,414 @@ def geo_count(tweets):
     return count
 
 '''--------------------------------------------------------------------------'''
+'''Map/Reduce over quake files'''
+'''--------------------------------------------------------------------------'''
+QuakePartial = namedtuple("QuakePartial", ['filename', 'num_tweets', 'geo',
+                                           'ids', 'langs', 'wordcounts',
+                                           'metrics', 'bins'])
+#   quake_partial :: Filename -> Source -> QuakePartial
+def quake_partial(tweet_file, source=READ_RAW):
+    """
+    Processes one quake file end to end (window, geo count, graph) and
+    returns what main needs from it to merge with the other files.
+    """
+    with metrics.recording() as recorded, metrics.in_file(tweet_file):
+        quake = quake_from_filename(tweet_file)
+        data = file_timely_data(tweet_file, quake.date, source,
+                                compact=True)
+        tweets = remove_retweets(data)
+        bins = None
+        if len(data) > 200:
+            with metrics.stage("graph"):
+                bins = [x.tolist() for x in
+                        tweet_histogram(tweets, epoch_seconds(quake.date))]
+                draw_histogram(bins[0], bins[1],
+                               replace_extension(tweet_file, "png"),
+                               displayname_from_filename(tweet_file))
+        with metrics.stage("wordcount"):
+            wordcounts = wordcounts_by_lang(tweets)
+    return QuakePartial(filename=tweet_file, num_tweets=len(data),
+                        geo=geo_count(data),
+                        ids=set(x["id"] for x in tweets),
+                        langs=lang_counts(tweets),
+                        wordcounts=wordcounts,
+                        metrics=recorded.as_dict(), bins=bins)
+
+#   duplicate_partial :: (Filename, Set Id, Source) -> ({Lang:Int}, {Lang:{Word:Count}}, Dict)
+def duplicate_partial(args):
+    """
+    Counts for the tweets of a file that were already counted from an
+    earlier file, to be taken back out of the merged counts.
+    """
+    (tweet_file, ids, source) = args
+    with metrics.recording() as recorded, metrics.in_file(tweet_file), \
+         metrics.stage("duplicates"):
+        quake = quake_from_filename(tweet_file)
+        data = file_timely_data(tweet_file, quake.date, source,
+                                compact=True)
+        tweets = [x for x in remove_retweets(data) if x["id"] in ids]
+        counts = (lang_counts(tweets), wordcounts_by_lang(tweets))
+    # only the time, the tweets were counted on their first read
+    return counts + (recorded.as_dict(counters=False),)
+
+#   lang_counts :: [Dict] -> {Lang:Int}
+def lang_counts(tweets):
+    return dict((lang, len(x))
+                for lang, x in split_tweets_by_lang(tweets).iteritems())
+
+#   merge_counts :: {a:Int} -> {a:Int} -> Int -> IO ()
+def merge_counts(total, counts, sign=1):
+    """Adds (or with sign=-1 takes away) counts into total, in place"""
+    for key, count in counts.iteritems():
+        merged = total.get(key, 0) + sign * count
+        if merged:
+            total[key] = merged
+        else:
+            total.pop(key, None)
+
+#   add_wordcounts :: {Lang:Counts} -> {Lang:{Word:Count}} -> Int -> (() -> WordSketch) -> IO ()
+def add_wordcounts(total, counts, sign=1, make_sketch=None):
+    """
+    Adds (or with sign=-1 takes away) word counts into total, in place, as
+    exact dicts or, given make_sketch, into a WordSketch per language.
+    """
+    for lang, words in counts.iteritems():
+        if make_sketch is None:
+            merge_counts(total.setdefault(lang, {}), words, sign)
+        else:
+            if lang not in total:
+                total[lang] = make_sketch()
+            total[lang].add(words, sign)
+
+#   top_words :: Counts -> Int -> [(Word, Count)]
+def top_words(counts, count):
+    """The count most frequent words of a dict or a WordSketch"""
+    if isinstance(counts, WordSketch):
+        return counts.top(count)
+    return sorted(counts.iteritems(), key=lambda x: (-x[1], x[0]))[:count]
+
+#   reduce_partials :: [QuakePartial] -> (Int -> a) -> IdSet -> Source -> (() -> WordSketch) -> ({Lang:Counts}, Int, [(Filename, Int)])
+def reduce_partials(partials, pool_map=map, seen=None, source=READ_RAW,
+                    make_sketch=None):
+    """
+    Merges the per file partials into the same word counts, number of
+    earthquakes used and geo files that the serial main computes.  A tweet
+    found in several files is counted once, for the first file, and not at
+    all if its id is already in seen.  Given make_sketch, the word counts
+    of each language go into a WordSketch instead of a dict.
+    """
+    num_eq = len([x for x in partials if x.num_tweets])
+    geo_files = [(x.filename, x.geo) for x in partials if x.geo > 100]
+    if seen is None:
+        seen = IdSet()
+    duplicates = []
+    langs = {}
+    counts = {}
+    for partial in partials:
+        metrics.current().merge(partial.metrics)
+        dups = set(x for x in partial.ids if not seen.add(x))
+        if dups:
+            duplicates.append((partial.filename, dups, source))
+        merge_counts(langs, partial.langs)
+        add_wordcounts(counts, partial.wordcounts, 1, make_sketch)
+    dup_partials = pool_map(duplicate_partial, duplicates)
+    for ((tweet_file, _, _), (dup_langs, dup_counts, dup_metrics)) in \
+        zip(duplicates, dup_partials):
+        metrics.current().merge(dup_metrics)
+        with metrics.in_file(tweet_file):
+            metrics.count("duplicates_dropped", sum(dup_langs.values()))
+        merge_counts(langs, dup_langs, -1)
+        add_wordcounts(counts, dup_counts, -1, make_sketch)
+    for lang in counts.keys():
+        if lang not in langs:
+            del counts[lang]
+    return (counts, num_eq, geo_files)
+
+'''--------------------------------------------------------------------------'''
+#   add_source_arguments :: ArgumentParser -> ()
+def add_source_arguments(parser):
+    """The -c/-i choice of where the tweet files are read from"""
+    read = parser.add_mutually_exclusive_group()
+    read.add_argument('-c', '--cache', dest='source', action='store_const',
+                      const=READ_CACHE, default=READ_RAW,
+                      help='Read the tweet files through columnar sidecar '
+                      'caches, built next to them on first use.')
+    read.add_argument('-i', '--index', dest='source', action='store_const',
+                      const=READ_INDEX,
+                      help='Read only the window of each tweet file through '
+                      'a time index, built next to it on first use.')
+
+#   add_wordcount_arguments :: ArgumentParser -> ()
+def add_wordcount_arguments(parser):
+    parser.add_argument('tweet_files', nargs='*',
+                        help='Quake files named mag_lat_lon_date.json')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Worker processes, each handling one quake file.')
+    parser.add_argument('-s', '--seen-ids',
+                        help='File of tweet ids counted by earlier runs. They '
+                        'are skipped and the ids of this run are added.')
+    add_source_arguments(parser)
+    parser.add_argument('-P', '--partials',
+                        help='Directory of the partial counts of each quake '
+                        'file, by content. Only new or changed files are '
+                        'read, the others are merged from here.')
+    parser.add_argument('-k', '--sketch', action='store_true',
+                        help='Count words in a fixed size Count-Min sketch '
+                        'per language instead of exact dicts.')
+    parser.add_argument('--sketch-width', type=int, default=WIDTH,
+                        help='Counters per sketch row.')
+    parser.add_argument('--sketch-depth', type=int, default=DEPTH,
+                        help='Rows per sketch.')
+    parser.add_argument('--sketch-out',
+                        help='Save the sketches here, to merge with sketch.py. '
+                        'Implies -k.')
+    parser.add_argument('-n', '--top', type=int,
+                        help='Print only the N most frequent words, most '
+                        'frequent first.')
+    parser.add_argument('-m', '--metrics',
+                        help='Write the counts and times of each stage and '
+                        'input file to this JSON file.')
+    parser.add_argument('-p', '--profile',
+                        help='Write a cProfile of the run to this file. Only '
+                        'the main process is profiled, use -w 1 to see it '
+                        'all.')
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    add_wordcount_arguments(parser)
+    return parser.parse_args()
+
+#   print_wordcounts :: {Word:Count} -> IO ()
+def print_wordcounts(counts):
+    for word, count in sorted(counts.items()):
+        try:
+            print(unicode("{word}\t{count}").format(word=word, count=count))
+        except UnicodeEncodeError:
+            logging.info(word)
+            raise
+
 def main():
     logging.basicConfig(level=logging.INFO)
-    tweet_files = sys.argv[1:]
+    main_wordcount(parse_arguments())
+
+#   main_wordcount :: Namespace -> IO ()
+def main_wordcount(args):
+    """Word counts of the quake files, as asked for by the wordcount args"""
+    tweet_files = args.tweet_files
     logging.info("# earthquake files: {0}".format(len(tweet_files)))
-    tweets = []
+    seen = IdSet(args.seen_ids)
+    make_sketch = None
+    if args.sketch or args.sketch_out:
+        make_sketch = functools.partial(WordSketch, args.sketch_width,
+                                        args.sketch_depth,
+                                        max(CAPACITY, 2 * (args.top or 0)))
+    profile = None
+    if args.profile:
+        profile = cProfile.Profile()
+        profile.enable()
+    if args.partials:
+        (counts, num_eq, geo_files) = main_incremental(tweet_files,
+                                                       args.partials,
+                                                       args.workers, seen,
+                                                       args.source,
+                                                       make_sketch)
+    elif args.workers > 1:
+        (counts, num_eq, geo_files) = main_parallel(tweet_files, args.workers,
+                                                    seen, args.source,
+                                                    make_sketch)
+    else:
+        (counts, num_eq, geo_files) = main_serial(tweet_files, seen,
+                                                  args.source, make_sketch)
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.profile)
+        pstats.Stats(profile, stream=sys.stderr).sort_stats(
+            "cumulative").print_stats(20)
+    if args.metrics:
+        metrics.current().save(args.metrics)
+    if args.seen_ids:
+        seen.save()
+
+    if args.sketch_out:
+        save_sketches(args.sketch_out, counts)
+    if args.top:
+        for (word, count) in top_words(counts.get("en", {}), args.top):
+            print(unicode("{word}\t{count}").format(word=word, count=count))
+    else:
+        print_wordcounts(counts.get("en", {}))
+    logging.info("# earthquakes used: {0}".format(num_eq))
+    for (name, geo) in geo_files:
+        logging.info("{0}\t{1}".format(name, geo))
+
+#   main_serial :: [Filename] -> IdSet -> Source -> (() -> WordSketch) -> IO ({Lang:Counts}, Int, [(Filename, Int)])
+def main_serial(tweet_files, seen=None, source=READ_RAW, make_sketch=None):
+    counts = {}
     num_eq = 0
     geo_files = []
-    count = 0
     for tweet_file in tweet_files:
         if not os.path.exists(tweet_file) or not os.path.isfile(tweet_file):
             logging.info("continue")
             continue
-        quake = quake_from_filename(tweet_file)
-        with open(tweet_file, "r") as fileobj:
-            data = timely_data(fileobj, quake.date)
+        with metrics.in_file(tweet_file):
+            quake = quake_from_filename(tweet_file)
+            data = file_timely_data(tweet_file, quake.date, source,
+                                    compact=True)
             geo = geo_count(data)
             if geo > 100:
                 geo_files.append((tweet_file, geo))
             if len(data):
                 num_eq += 1
 
-            if len(data) > 200:                                
-                graph_tweets(remove_retweets(data), replace_extension(tweet_file, "png"),
-                             displayname_from_filename(tweet_file))
-
-            tweets += remove_retweets(data)
-
-    uniques = unique_tweets(tweets)
-    counts = wordcounts_by_lang(uniques)
-
-    for word, count in counts["en"].items():
-        try:
-            print(unicode("{word}\t{count}").format(word=word, count=count))
-        except UnicodeEncodeError:
-            logging.info(word)
-            raise
-    logging.info("# earthquakes used: {0}".format(num_eq))
-    for (name, geo) in geo_files:
-        logging.info("{0}\t{1}".format(name, geo))
+            file_tweets = remove_retweets(data)
+            if len(data) > 200:
+                with metrics.stage("graph"):
+                    graph_tweets(file_tweets,
+                                 replace_extension(tweet_file, "png"),
+                                 displayname_from_filename(tweet_file),
+                                 epoch_seconds(quake.date))
+
+            tweets = list(unique_by_id(file_tweets, seen))
+            metrics.count("duplicates_dropped", len(file_tweets) - len(tweets))
+            with metrics.stage("wordcount"):
+                add_wordcounts(counts, wordcounts_by_lang(tweets), 1,
+                               make_sketch)
+    return (counts, num_eq, geo_files)
+
+#   main_parallel :: [Filename] -> Int -> IdSet -> Source -> (() -> WordSketch) -> IO ({Lang:Counts}, Int, [(Filename, Int)])
+def main_parallel(tweet_files, workers, seen=None, source=READ_RAW,
+                  make_sketch=None):
+    existing = []
+    for tweet_file in tweet_files:
+        if not os.path.exists(tweet_file) or not os.path.isfile(tweet_file):
+            logging.info("continue")
+            continue
+        existing.append(tweet_file)
+    pool = multiprocessing.Pool(workers)
+    try:
+        partials = pool.map(functools.partial(quake_partial,
+                                              source=source), existing)
+        return reduce_partials(partials, pool.map, seen, source, make_sketch)
+    finally:
+        pool.close()
+        pool.join()
+
+#   partial_dict :: QuakePartial -> Dict
+def partial_dict(partial):
+    """What a PartialStore keeps of a partial, all but its file and metrics"""
+    return {"num_tweets": partial.num_tweets, "geo": partial.geo,
+            "ids": sorted(partial.ids), "langs": partial.langs,
+            "wordcounts": partial.wordcounts, "bins": partial.bins}
+
+#   dict_partial :: Filename -> Dict -> QuakePartial
+def dict_partial(tweet_file, stored):
+    return QuakePartial(filename=tweet_file, num_tweets=stored["num_tweets"],
+                        geo=stored["geo"], ids=set(stored["ids"]),
+                        langs=stored["langs"],
+                        wordcounts=stored["wordcounts"],
+                        metrics=metrics.Metrics().as_dict(),
+                        bins=stored["bins"])
+
+#   cached_duplicates :: PartialStore -> {Filename:String} -> ((a -> b) -> [a] -> [b]) -> ((a -> b) -> [a] -> [b])
+def cached_duplicates(store, keys, pool_map=map):
+    """
+    A pool_map for the duplicate_partial jobs of reduce_partials that takes
+    the counts of a file and set of duplicate ids from store when they were
+    stored by an earlier run, and runs and stores the others.
+    """
+    def duplicates_map(function, jobs):
+        dup_keys = [digest_of([keys[tweet_file]] +
+                              [str(x) for x in sorted(ids)])
+                    for (tweet_file, ids, _) in jobs]
+        results = [store.get(x) for x in dup_keys]
+        missing = [i for (i, x) in enumerate(results) if x is None]
+        computed = pool_map(function, [jobs[i] for i in missing])
+        for (i, (langs, counts, recorded)) in zip(missing, computed):
+            store.put(dup_keys[i], {"langs": langs, "wordcounts": counts})
+            results[i] = (langs, counts, recorded)
+        metrics.count("duplicates_reused", len(jobs) - len(missing))
+        return [(x["langs"], x["wordcounts"], metrics.Metrics().as_dict())
+                if isinstance(x, dict) else x for x in results]
+    return duplicates_map
+
+#   main_incremental :: [Filename] -> Filename -> Int -> IdSet -> Source -> (() -> WordSketch) -> IO ({Lang:Counts}, Int, [(Filename, Int)])
+def main_incremental(tweet_files, partials_dir, workers=1, seen=None,
+                     source=READ_RAW, make_sketch=None):
+    """
+    main_parallel over the partials stored in partials_dir: only the quake
+    files that are new or changed since an earlier run are read, the
+    partials of the others are merged as they were stored.  A chart that is
+    missing is drawn again from its stored bins.
+    """
+    store = PartialStore(partials_dir, PARTIALS_VERSION)
+    existing = []
+    for tweet_file in tweet_files:
+        if not os.path.exists(tweet_file) or not os.path.isfile(tweet_file):
+            logging.info("continue")
+            continue
+        existing.append(tweet_file)
+    keys = dict((x, store.key(x)) for x in existing)
+    stored = dict((x, store.get(keys[x])) for x in existing)
+    missing = [x for x in existing if stored[x] is None]
+    logging.info("# stored partials: {0}, to compute: {1}".format(
+        len(existing) - len(missing), len(missing)))
+    pool = None
+    pool_map = map
+    if workers > 1 and len(missing) > 1:
+        pool = multiprocessing.Pool(min(workers, len(missing)))
+        pool_map = pool.map
+    try:
+        computed = pool_map(functools.partial(quake_partial, source=source),
+                            missing)
+        for partial in computed:
+            store.put(keys[partial.filename], partial_dict(partial))
+            stored[partial.filename] = partial
+        partials = []
+        for tweet_file in existing:
+            partial = stored[tweet_file]
+            if isinstance(partial, dict):
+                partial = dict_partial(tweet_file, partial)
+                png = replace_extension(tweet_file, "png")
+                if partial.bins is not None and not os.path.exists(png):
+                    with metrics.in_file(tweet_file), metrics.stage("graph"):
+                        draw_histogram(partial.bins[0], partial.bins[1], png,
+                                       displayname_from_filename(tweet_file))
+            partials.append(partial)
+        metrics.count("partials_reused", len(existing) - len(missing))
+        result = reduce_partials(partials,
+                                 cached_duplicates(store, keys, pool_map),
+                                 seen, source, make_sketch)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    store.save()
+    return result
 
 
 
 def main_geo():
     tweet_file = sys.argv[1]
+    source = READ_RAW
+    if "--cache" in sys.argv[2:]:
+        source = READ_CACHE
+    elif "--index" in sys.argv[2:]:
+        source = READ_INDEX
+    print_geo(tweet_file, source)
+
+#   print_geo :: Filename -> Source -> IO ()
+def print_geo(tweet_file, source=READ_RAW):
+    """The geotagged tweets of a quake file as a javascript array"""
     print("var obj = [")
     quake = quake_from_filename(tweet_file)
-    with open(tweet_file, "r") as fileobj:
-        data = timely_data(fileobj, quake.date)
-
-        for obj in unique_tweets(data):
-            if "coordinates" in obj and obj["coordinates"] != None:
-                coordinates = obj["coordinates"]
-                assert "type" in coordinates and coordinates["type"] == "Point"
-                lon = coordinates["coordinates"][0]
-                lat = coordinates["coordinates"][1]
-                print("\tnew google.maps.LatLng({lat}, {lon}),".format(lat=lat, lon=lon))
+    data = file_timely_data(tweet_file, quake.date, source)
+
+    for obj in unique_tweets(data):
+        if "coordinates" in obj and obj["coordinates"] != None:
+            coordinates = obj["coordinates"]
+            assert "type" in coordinates and coordinates["type"] == "Point"
+            lon = coordinates["coordinates"][0]
+            lat = coordinates["coordinates"][1]
+            print("\tnew google.maps.LatLng({lat}, {lon}),".format(lat=lat, lon=lon))
     print("]")
 
 #   main :: IO()
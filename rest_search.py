@@ -8,11 +8,24 @@ import sys
 from datetime import datetime, timedelta
 from collections import namedtuple
 import os.path
+import argparse
+import functools
+import threading
+import Queue
 
 import logging
 
+from rate_limit import TokenBucket
+from tweet_time import millis_datetime
+from catalog import Catalog, iter_features, feed_table, row_values, \
+    add_query_arguments, query_arguments, epoch_millis
+
 # 180 times in 15 min
-REQUEST_INTERVAL = (15*60) / 180.0
+REQUEST_LIMIT = 180
+REQUEST_PERIOD = 15*60
+REQUEST_INTERVAL = REQUEST_PERIOD / float(REQUEST_LIMIT)
+# tweets are searched for this far from the epicenter
+SEARCH_RADIUS_KM = 250
 
 '''--------------------------------------------------------------------------'''
 '''USGS data handling'''
@@ -24,9 +37,7 @@ def date_mag_from_prop(prop):
     magnitude"""
     assert "time" in prop
     assert "mag" in prop
-    # epoc_sec :: Sec 1
-    epoc_sec = prop["time"] / 1000.0 #Assumed to be in UTC
-    prop_date = datetime.utcfromtimestamp(epoc_sec)
+    prop_date = millis_datetime(prop["time"]) #Assumed to be in UTC
     mag = prop["mag"]
     return (prop_date, mag)
 
@@ -55,13 +66,21 @@ def quakes_from_usgs_data(earthquakes):
         eq_data.append(Quake(lat=lat, lon=lon, mag=magnitude, date=prop_date))
     return eq_data
 
+#   quakes_from_rows :: Array -> [Quake]
+def quakes_from_rows(rows):
+    """The quakes of rows of a catalog table"""
+    return [Quake(lat=lat, lon=lon, mag=mag, date=millis_datetime(time))
+            for (time, mag, lat, lon, _) in row_values(rows)]
+
 #   earthquakes_from_file :: Filename -> IO([Quake])
 def earthquakes_from_file(filename):
-    data = None
-    with open(filename, "r") as usgs_file:
-        data = json.load(usgs_file)
-    assert "features" in data
-    return quakes_from_usgs_data(data["features"])
+    """
+    The quakes of a GeoJSON feed, read a feature at a time, or of every
+    event in a catalog store directory.
+    """
+    if os.path.isdir(filename):
+        return quakes_from_rows(Catalog(filename).table)
+    return quakes_from_usgs_data(iter_features(filename))
 
 '''--------------------------------------------------------------------------'''
 '''Twitter handling'''
@@ -73,7 +92,8 @@ def query_params(lat, lon, date):
     until_day = date + timedelta(days=2)
     params["q"] = "earthquake"
     params["count"] = 100
-    params["geocode"] = "{lat},{lon},250km".format(lat=lat, lon=lon)
+    params["geocode"] = "{lat},{lon},{radius}km".format(lat=lat, lon=lon,
+                                                        radius=SEARCH_RADIUS_KM)
     params["until"] = until_day.strftime("%Y-%m-%d")
     return params
 
@@ -95,14 +115,91 @@ def get_auth(filename):
 
     return auth
 
+#   get_auths :: Filename -> IO ([Dict])
+def get_auths(filename):
+    """Every credential in the file, one json object per line"""
+    auths = []
+    with open(filename, "r") as auth_file:
+        for line in auth_file:
+            line = line.strip()
+            if len(line):
+                auths.append(json.loads(line))
+
+    return auths
+
 def make_obj():
     auth = get_auth("auth.txt")
+    return make_twitter(auth)
+
+#   make_twitter :: Dict -> String -> Twython
+def make_twitter(auth, api_url=None):
+    """
+    Twython client for the credential.  api_url (e.g. http://localhost:8000)
+    points it at another server, such as a local stub of the search api.
+    """
     t = Twython(auth["consumer_key"],
                 auth["consumer_secret"],
                 auth["oauth_token"],
                 auth["oauth_token_secret"])
+    if api_url is not None:
+        t.api_url = api_url.rstrip("/") + "/%s"
     return t
 
+class CredentialPool(object):
+    """
+    Spreads searches over several credentials, each with its own token
+    bucket, always using the one with budget soonest.  Every thread gets its
+    own client per credential so the rate limit headers read after a search
+    are those of that search.
+    """
+    def __init__(self, auths, make_client=make_twitter,
+                 make_bucket=TokenBucket, sleep=time.sleep):
+        self.auths = auths
+        self.buckets = [make_bucket() for _ in auths]
+        self.make_client = make_client
+        self.sleep = sleep
+        self.local = threading.local()
+
+    def client(self, index):
+        if not hasattr(self.local, "clients"):
+            self.local.clients = {}
+        if index not in self.local.clients:
+            self.local.clients[index] = self.make_client(self.auths[index])
+        return self.local.clients[index]
+
+    #   acquire :: () -> IO Int
+    def acquire(self):
+        """Waits for a request slot and returns its credential index"""
+        while True:
+            (wait, index) = min((bucket.wait_time(), index)
+                                for index, bucket in enumerate(self.buckets))
+            if wait > 0:
+                self.sleep(wait)
+            elif self.buckets[index].try_acquire():
+                return index
+
+    def search(self, **params):
+        index = self.acquire()
+        client = self.client(index)
+        logging.info(params)
+        result = client.search(**params)
+        remaining = client.get_lastfunction_header('x-rate-limit-remaining')
+        reset = client.get_lastfunction_header('x-rate-limit-reset')
+        if remaining is not None:
+            self.buckets[index].sync(int(remaining),
+                                     float(reset) if reset else None)
+        return result
+
+#   paged_search :: (Dict -> IO Dict) -> (Dict -> IO Dict)
+def paged_search(search):
+    """Wraps a search function with what cursor needs to page through it"""
+    def function(**params):
+        return search(**params)
+    function.iter_mode = 'id'
+    function.iter_key = 'statuses'
+    function.iter_metadata = 'search_metadata'
+    return function
+
 def cursor(self, function, **params):
 
     if not hasattr(function, 'iter_mode'):
@@ -147,40 +244,153 @@ def cursor(self, function, **params):
             raise TwythonError('Unable to generate next page of search \
             results, `page` is not a number.')
 
+#   harvest_quake :: Quake -> Filename -> (Dict -> IO Dict) -> IO ()
+def harvest_quake(quake, filepath, search):
+    """
+    Appends the search results of the quake to its file as they arrive,
+    saving a checkpoint as it goes.  An interrupted crawl resumes below the
+    last tweet written, and once a crawl has finished later runs only ask
+    for tweets newer than the ones in the file.
+    """
+    params = query_params(quake.lat, quake.lon, quake.date)
+    state = load_checkpoint(filepath)
+    extra = {}
+    if state["since_id"] is not None:
+        extra["since_id"] = state["since_id"]
+    if state["max_id"] is not None:
+        extra["max_id"] = state["max_id"]
+        logging.info("resuming {0} at {1}".format(filepath, state["max_id"]))
+    results = cursor(None, search, q=params["q"],
+                     count=params["count"], geocode=params["geocode"],
+                     **extra)
+    #until=params["until"])
+    quake_file = None
+    try:
+        for result in results:
+            if quake_file is None:
+                quake_file = open(filepath, "a")
+            quake_file.write(json.dumps(result))
+            quake_file.write("\n")
+            if "id" in result:
+                quake_file.flush()
+                state["max_id"] = result["id"] - 1
+                state["top_id"] = max(state["top_id"], result["id"])
+                save_checkpoint(filepath, state)
+    finally:
+        if quake_file is not None:
+            quake_file.close()
+    # everything up to the newest tweet of this crawl is in the file now
+    save_checkpoint(filepath, {"since_id": max(state["since_id"],
+                                               state["top_id"]),
+                               "max_id": None, "top_id": None})
+
+#   checkpoint_path :: Filename -> Filename
+def checkpoint_path(filepath):
+    return filepath + ".ckpt"
+
+#   load_checkpoint :: Filename -> IO Dict
+def load_checkpoint(filepath):
+    """
+    The crawl frontier of a quake file: since_id, below which every tweet
+    is in the file, and while a crawl is unfinished the max_id to resume at
+    and the top_id it started from.  A file from before checkpoints counts
+    as a finished crawl up to its newest tweet.
+    """
+    path = checkpoint_path(filepath)
+    if os.path.exists(path):
+        with open(path, "r") as checkpoint_file:
+            return json.load(checkpoint_file)
+    state = {"since_id": None, "max_id": None, "top_id": None}
+    if os.path.exists(filepath):
+        with open(filepath, "r") as quake_file:
+            for line in quake_file:
+                try:
+                    tweet = json.loads(line)
+                except ValueError:
+                    continue
+                if "id" in tweet:
+                    state["since_id"] = max(state["since_id"], tweet["id"])
+    return state
+
+#   save_checkpoint :: Filename -> Dict -> IO ()
+def save_checkpoint(filepath, state):
+    path = checkpoint_path(filepath)
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(state, checkpoint_file)
+    os.rename(path + ".tmp", path)
+
+#   harvest :: [(Quake, Filename)] -> (Dict -> IO Dict) -> Int -> IO ()
+def harvest(jobs, search, workers=1):
+    """
+    Runs the paginated searches of several quakes at once on worker
+    threads.  The pages of one quake follow each other, the quakes
+    interleave, and search decides when a request may go out.
+    """
+    queue = Queue.Queue()
+    for job in jobs:
+        queue.put(job)
+
+    def worker():
+        while True:
+            try:
+                (quake, filepath) = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                harvest_quake(quake, filepath, search)
+            except TwythonError as err:
+                logging.error("{0}: {1}".format(filepath, err))
+            except Exception:
+                # a dropped connection or a bad response loses this quake,
+                # not the ones still queued for this thread
+                logging.exception("{0}: harvest failed".format(filepath))
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(max(1, min(workers, len(jobs))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('quake_file', help='USGS GeoJSON earthquake feed.')
+    parser.add_argument('data_dir', help='Directory for the quake files.')
+    parser.add_argument('-a', '--auth', default="auth.txt",
+                        help='Credentials, one json object per line.')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='Quakes searched at the same time.')
+    parser.add_argument('--api-url',
+                        help='Search another server, e.g. a local stub.')
+    parser.add_argument('-s', '--store',
+                        help='Catalog directory the feed is merged into and '
+                        'the quakes are picked from.')
+    add_query_arguments(parser)
+    return parser.parse_args()
+
 def main():
     logging.basicConfig(level=logging.INFO)
-    args = sys.argv[1:]
-    if len(args) < 2:
-        logging.error("not enough arguments")
-        return
-    quake_file = args[0]
-    data_dir = args[1]
-    quakes = earthquakes_from_file(quake_file)
-    twitter = make_obj()
-    def sleeper_search(**params):
-        logging.info(params)
-        result = twitter.search(**params)
-
-        time.sleep(REQUEST_INTERVAL)
-        return result
-    sleeper_search.iter_mode = 'id'
-    sleeper_search.iter_key = 'statuses'
-    sleeper_search.iter_metadata = 'search_metadata'
+    args = parse_arguments()
+    catalog = Catalog(args.store)
+    catalog.merge(feed_table(args.quake_file))
+    if args.store:
+        catalog.save()
+    query = query_arguments(args)
+    # search only keeps the last 10 days
+    recent = epoch_millis(datetime.utcnow() - timedelta(days=10))
+    if query["start"] is None or query["start"] < recent:
+        query["start"] = recent
+    quakes = quakes_from_rows(catalog.query(**query))
+    credentials = CredentialPool(get_auths(args.auth),
+                                 functools.partial(make_twitter,
+                                                   api_url=args.api_url))
+    jobs = []
     for quake in quakes:
-        params = query_params(quake.lat, quake.lon, quake.date)
         filename = earthquake_filename(quake)
-        filepath = os.path.join(data_dir, filename)
-        if os.path.exists(filepath) or quake.date < (datetime.utcnow() - timedelta(days=10)):
-            continue # don't re-look for ones we've found or from 10 days ago
-        results = cursor(twitter, sleeper_search, q=params["q"],
-                         count=params["count"], geocode=params["geocode"])
-    #until=params["until"])
-        result_list = [x for x in results]
-        if len(result_list):
-            with open(filepath, "w") as quake_file:
-                for result in result_list:
-                    quake_file.write(json.dumps(result))
-                    quake_file.write("\n")
+        filepath = os.path.join(args.data_dir, filename)
+        jobs.append((quake, filepath))
+    harvest(jobs, paged_search(credentials.search), args.workers)
 
 
 def main_old():
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Approximate word counts in bounded memory.  A WordSketch is a Count-Min
+sketch of every word plus a bounded set of heavy hitter candidates, the
+words with the largest estimates seen so far, from which the top words are
+read.  Sketches of the same shape add up exactly, so the sketches of
+separate processes or days can be merged, saved with save_sketches and
+merged again later with this script.
+"""
+
+from __future__ import print_function
+
+import os
+import hashlib
+import argparse
+
+import numpy as np
+
+WIDTH = 1 << 17
+DEPTH = 4
+# heavy hitter candidates kept, at least the N of the top N wanted
+CAPACITY = 2000
+
+class WordSketch(object):
+    """
+    Count-Min sketch of depth rows of width counters, with the capacity
+    words of highest estimate.  Estimates are never below the true count
+    and overshoot it by at most total/width * e with high probability.
+    """
+    def __init__(self, width=WIDTH, depth=DEPTH, capacity=CAPACITY):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self.candidates = {}
+
+    def _columns(self, words):
+        """The counter of each word in each row, depth by len(words)"""
+        digests = np.frombuffer("".join(
+            hashlib.md5(x.encode("utf-8") if isinstance(x, unicode) else x)
+            .digest() for x in words), dtype=np.uint64).reshape(-1, 2)
+        # double hashing, row i uses h1 + i * h2
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((digests[:, 0] + rows * (digests[:, 1] | np.uint64(1))) %
+                np.uint64(self.width)).astype(np.int64)
+
+    #   add :: {Word:Count} -> Int -> ()
+    def add(self, counts, sign=1):
+        """Counts (or with sign=-1 uncounts) a dict of word counts"""
+        if not counts:
+            return
+        words = counts.keys()
+        amounts = np.array([counts[x] for x in words], dtype=np.int64) * sign
+        columns = self._columns(words)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], amounts)
+        self.total += int(amounts.sum())
+        estimates = self.table[np.arange(self.depth)[:, None],
+                               columns].min(axis=0)
+        self._offer(words, estimates)
+
+    #   estimate :: [Word] -> Array Int
+    def estimate(self, words):
+        if not len(words):
+            return np.zeros(0, dtype=np.int64)
+        columns = self._columns(words)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def _offer(self, words, estimates):
+        """Refreshes the candidates with new estimates of words"""
+        candidates = self.candidates
+        for (word, estimate) in zip(words, estimates):
+            if estimate > 0 or word in candidates:
+                candidates[word] = int(estimate)
+        if len(candidates) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        kept = sorted(self.candidates.iteritems(), key=lambda x: -x[1])
+        self.candidates = dict((word, count) for (word, count)
+                               in kept[:self.capacity] if count > 0)
+
+    #   merge :: WordSketch -> Int -> ()
+    def merge(self, other, sign=1):
+        """Adds (or with sign=-1 takes away) a sketch of the same shape"""
+        if self.table.shape != other.table.shape:
+            raise ValueError("cannot merge a {0} sketch into a {1} "
+                             "one".format(other.table.shape, self.table.shape))
+        self.table += sign * other.table
+        self.total += sign * other.total
+        words = list(set(self.candidates) | set(other.candidates))
+        self.candidates = {}
+        self._offer(words, self.estimate(words))
+
+    #   top :: Int -> [(Word, Count)]
+    def top(self, count):
+        """The count words of highest estimate, highest first"""
+        words = self.candidates.keys()
+        estimates = self.estimate(words)
+        ranked = sorted(zip(words, estimates), key=lambda x: (-x[1], x[0]))
+        return [(word, int(estimate)) for (word, estimate) in ranked[:count]
+                if estimate > 0]
+
+    #   items :: () -> [(Word, Count)]
+    def items(self):
+        return self.top(len(self.candidates))
+
+#   save_sketches :: Filename -> {Lang:WordSketch} -> IO ()
+def save_sketches(filename, sketches):
+    arrays = {}
+    for (lang, sketch) in sketches.iteritems():
+        words = sketch.candidates.keys()
+        arrays[lang + "/table"] = sketch.table
+        arrays[lang + "/meta"] = np.array([sketch.total, sketch.capacity],
+                                          dtype=np.int64)
+        arrays[lang + "/words"] = np.array(
+            [(x if isinstance(x, unicode) else x.decode("utf-8"))
+             for x in words], dtype=np.unicode_)
+    with open(filename + ".tmp", "wb") as sketch_file:
+        np.savez(sketch_file, **arrays)
+    os.rename(filename + ".tmp", filename)
+
+#   load_sketches :: Filename -> IO {Lang:WordSketch}
+def load_sketches(filename):
+    sketches = {}
+    with np.load(filename) as arrays:
+        for name in arrays.files:
+            (lang, field) = name.rsplit("/", 1)
+            if field != "table":
+                continue
+            table = arrays[name]
+            (total, capacity) = arrays[lang + "/meta"]
+            sketch = WordSketch(table.shape[1], table.shape[0], int(capacity))
+            sketch.table = table
+            sketch.total = int(total)
+            words = list(arrays[lang + "/words"])
+            sketch._offer(words, sketch.estimate(words))
+            sketches[lang] = sketch
+    return sketches
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('sketch_files', nargs='+',
+                        help='Sketches saved by rest_data_process '
+                        '--sketch-out.')
+    parser.add_argument('-o', '--out', help='Save the merged sketches here.')
+    parser.add_argument('-n', '--top', type=int, default=500,
+                        help='Words printed per language.')
+    parser.add_argument('-l', '--lang', nargs='*',
+                        help='Only print these languages.')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    merged = {}
+    for sketch_file in args.sketch_files:
+        for (lang, sketch) in load_sketches(sketch_file).iteritems():
+            if lang in merged:
+                merged[lang].merge(sketch)
+            else:
+                merged[lang] = sketch
+    if args.out:
+        save_sketches(args.out, merged)
+    for lang in sorted(merged):
+        if args.lang and lang not in args.lang:
+            continue
+        for (word, count) in merged[lang].top(args.top):
+            print(u"{0}\t{1}\t{2}".format(lang, word, count).encode("utf-8"))
+
+if __name__ == "__main__":
+    main()
@@ -23,21 +23,24 @@ import json
 def parse_arguments():
 
     parser = argparse.ArgumentParser(description=__doc__ or "")
+    add_stream_arguments(parser)
+    return parser.parse_args()
+
+def add_stream_arguments(parser, required=True):
 
-    parser.add_argument('-t',  '--token', required=True, help='The Twitter Access Token.')
-    parser.add_argument('-ts', '--token-secret', required=True, help='The Twitter Access Token Secret.')
-    parser.add_argument('-ck', '--consumer-key', required=True, help='The Twitter Consumer Key.')
-    parser.add_argument('-cs', '--consumer-secret', required=True, help='The Twitter Consumer Secret.')
+    parser.add_argument('-t',  '--token', required=required, help='The Twitter Access Token.')
+    parser.add_argument('-ts', '--token-secret', required=required, help='The Twitter Access Token Secret.')
+    parser.add_argument('-ck', '--consumer-key', required=required, help='The Twitter Consumer Key.')
+    parser.add_argument('-cs', '--consumer-secret', required=required, help='The Twitter Consumer Secret.')
     parser.add_argument('-us', '--user-stream', action='store_true', help='Connect to the user stream endpoint.')
     parser.add_argument('-ss', '--site-stream', action='store_true', help='Connect to the site stream endpoint.')
     parser.add_argument('-to', '--timeout', help='Timeout for the stream (seconds).')
     parser.add_argument('-ht', '--heartbeat-timeout', help='Set heartbeat timeout.', default=90)
     parser.add_argument('-nb', '--no-block', action='store_true', help='Set stream to non-blocking.')
     parser.add_argument('-tt', '--track-keywords', help='Search the stream for specific text.')
-    return parser.parse_args()
 
-def main():
-    args = parse_arguments()
+def stream_iter(args):
+    """The iterator of stream messages asked for by the stream arguments"""
 
     # When using twitter stream you must authorize.
     auth = OAuth(args.token, args.token_secret, args.consumer_key, args.consumer_secret)
@@ -64,6 +67,11 @@ def main():
             tweet_iter = stream.statuses.filter(**query_args)
         else:
             tweet_iter = stream.statuses.sample()
+    return tweet_iter
+
+def main():
+    args = parse_arguments()
+    tweet_iter = stream_iter(args)
 
     # Iterate over the sample stream.
     for tweet in tweet_iter:
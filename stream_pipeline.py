@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Matches a stream of tweets against a USGS earthquake catalog as they arrive.
+Every tweet goes through the same window and geo checks as timely_data and
+geo_count, the per quake counts are kept up to date, and matched tweets are
+written to one file per quake through a bounded queue.  The tweets come from
+the twitter stream or from replayed JSONL files.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import json
+import time
+import bisect
+import heapq
+import mmap
+import logging
+import argparse
+import threading
+import Queue
+from collections import deque
+from datetime import datetime
+
+from rest_data_process import date_timely, WINDOW_BEFORE, WINDOW_AFTER
+from rest_search import earthquakes_from_file, earthquake_filename
+from dedup import IdSet
+from quake_index import QuakeIndex
+from tweet_index import load_index
+from tweet_cache import created_epoch, NO_TIME
+from tweet_io import open_tweet_file, is_compressed
+from tweet_time import parse_created_at
+from histogram import MINUTE
+
+# per minute counts kept for the rolling rate
+RATE_MINUTES = 10
+
+'''--------------------------------------------------------------------------'''
+'''Sources'''
+'''--------------------------------------------------------------------------'''
+#   replay_source :: [Filename] -> Bool -> Iterator Dict
+def replay_source(filenames, in_time_order=False):
+    """
+    The tweets of JSONL files, as if they were streamed.  The REST search
+    writes newest first, so with in_time_order the files are read through
+    their time indexes and merged oldest first, like a live stream.
+    """
+    if in_time_order:
+        lines = heapq.merge(*[indexed_lines(x) for x in filenames])
+        lines = (line for (_, line) in lines)
+    else:
+        lines = file_lines(filenames)
+    for line in lines:
+        line = line.strip()
+        if len(line):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logging.info("ValueError")
+
+#   file_lines :: [Filename] -> Iterator String
+def file_lines(filenames):
+    """The lines of tweet files one after the other, each closed when read"""
+    for filename in filenames:
+        with open_tweet_file(filename) as tweet_file:
+            for line in tweet_file:
+                yield line
+
+#   indexed_lines :: Filename -> Iterator (Int, String)
+def indexed_lines(filename):
+    """The lines of a tweet file with their times, oldest first"""
+    if is_compressed(filename):
+        # no index of a compressed file, its lines are sorted in memory
+        with open_tweet_file(filename) as tweet_file:
+            lines = [line for line in tweet_file if line.strip()]
+        times = []
+        for line in lines:
+            try:
+                times.append(created_epoch(json.loads(line)))
+            except ValueError:
+                times.append(NO_TIME)
+        for (time, line) in sorted(zip(times, lines), key=lambda x: x[0]):
+            if time != NO_TIME:
+                yield (time, line)
+        return
+    index = load_index(filename)
+    with open(filename, "rb") as tweet_file:
+        data = mmap.mmap(tweet_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for (time, offset, length) in index:
+                yield (time, data[offset:offset + length])
+        finally:
+            data.close()
+
+#   twitter_source :: Namespace -> Iterator Dict
+def twitter_source(args):
+    """The tweets of the twitter stream asked for by the stream arguments"""
+    from stream_example import stream_iter
+    for tweet in stream_iter(args):
+        # None, Timeout, HeartbeatTimeout and Hangup are not dicts
+        if isinstance(tweet, dict) and tweet.get('text'):
+            yield tweet
+
+'''--------------------------------------------------------------------------'''
+'''Matching'''
+'''--------------------------------------------------------------------------'''
+class QuakeStats(object):
+    """Running counts of the tweets matched to one quake"""
+    def __init__(self):
+        self.tweets = 0
+        self.geo = 0
+        self.retweets = 0
+        # (minute, count), most recent last
+        self.minutes = deque(maxlen=RATE_MINUTES)
+
+    def add(self, tweet, minute):
+        self.tweets += 1
+        if "coordinates" in tweet and tweet["coordinates"] != None:
+            self.geo += 1
+        if "retweeted_status" in tweet:
+            self.retweets += 1
+        if self.minutes and self.minutes[-1][0] == minute:
+            self.minutes[-1] = (minute, self.minutes[-1][1] + 1)
+        else:
+            self.minutes.append((minute, 1))
+
+    #   rate :: Int -> Float
+    def rate(self, minute):
+        """Tweets per minute over the last RATE_MINUTES up to minute"""
+        recent = sum(count for (at, count) in self.minutes
+                     if minute - RATE_MINUTES < at <= minute)
+        return recent / float(RATE_MINUTES)
+
+class QuakeMatcher(object):
+    """
+    Sends each tweet to every quake of the catalog it is timely for, once
+    per tweet id, keeping a QuakeStats per quake.  A geotagged tweet only
+    goes to the nearest timely quake within the search radius.
+    """
+    def __init__(self, quakes, sink):
+        self.sink = sink
+        self.seen = IdSet()
+        self.stats = {}
+        # minute of the latest tweet matched, the clock of the rates
+        self.minute = None
+        self.set_quakes(quakes)
+
+    def set_quakes(self, quakes):
+        self.quakes = sorted(quakes, key=lambda x: x.date)
+        self.dates = [x.date for x in self.quakes]
+        self.index = QuakeIndex(self.quakes)
+
+    #   candidates :: Datetime -> [Quake]
+    def candidates(self, created_at):
+        """The quakes whose window holds created_at"""
+        low = bisect.bisect_left(self.dates, created_at - WINDOW_AFTER)
+        high = bisect.bisect_right(self.dates, created_at + WINDOW_BEFORE)
+        return [x for x in self.quakes[low:high]
+                if date_timely(created_at, x.date)]
+
+    #   process :: Dict -> IO [Quake]
+    def process(self, tweet):
+        if "created_at" not in tweet or "id" not in tweet:
+            return []
+        try:
+            created = parse_created_at(tweet["created_at"])
+        except (ValueError, TypeError):
+            return []
+        created_at = datetime.utcfromtimestamp(created)
+        if "coordinates" in tweet and tweet["coordinates"] != None:
+            (lon, lat) = tweet["coordinates"]["coordinates"][:2]
+            quake = self.index.nearest_quake(lat, lon, created_at)
+            quakes = [quake] if quake is not None else []
+        else:
+            quakes = self.candidates(created_at)
+        if not quakes or not self.seen.add(tweet["id"]):
+            return []
+        minute = created // MINUTE
+        self.minute = max(self.minute, minute)
+        for quake in quakes:
+            if quake not in self.stats:
+                self.stats[quake] = QuakeStats()
+            self.stats[quake].add(tweet, minute)
+            self.sink(quake, tweet)
+        return quakes
+
+'''--------------------------------------------------------------------------'''
+'''Output'''
+'''--------------------------------------------------------------------------'''
+class QuakeWriter(object):
+    """
+    Writes matched tweets to data_dir/earthquake_filename(quake) on its own
+    thread.  The queue is bounded, so put blocks while the writer is behind
+    and the source is slowed down instead of buffering without limit.
+    """
+    def __init__(self, data_dir, maxsize=10000):
+        self.data_dir = data_dir
+        self.queue = Queue.Queue(maxsize)
+        self.files = {}
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, quake, tweet):
+        self.queue.put((quake, tweet))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            (quake, tweet) = item
+            if quake not in self.files:
+                path = os.path.join(self.data_dir, earthquake_filename(quake))
+                self.files[quake] = open(path, "a")
+            self.files[quake].write(json.dumps(tweet))
+            self.files[quake].write("\n")
+        for quake_file in self.files.values():
+            quake_file.close()
+
+    def close(self):
+        """Writes what is queued and closes the files"""
+        self.queue.put(None)
+        self.thread.join()
+
+'''--------------------------------------------------------------------------'''
+#   log_stats :: QuakeMatcher -> IO ()
+def log_stats(matcher):
+    minute = matcher.minute
+    for quake, stats in sorted(matcher.stats.items(), key=lambda x: x[0].date):
+        logging.info("{0}\t{1}\t{2}\t{3}\t{4:.1f}/min".format(
+            earthquake_filename(quake), stats.tweets, stats.geo,
+            stats.retweets, stats.rate(minute)))
+
+#   run :: Iterator Dict -> Filename -> QuakeMatcher -> Int -> IO ()
+def run(source, catalog, matcher, report_every=60):
+    """
+    Feeds the source to the matcher, reloading the catalog file when it
+    changes and logging the per quake counts every report_every seconds.
+    """
+    mtime = os.path.getmtime(catalog)
+    last_report = time.time()
+    for tweet in source:
+        matcher.process(tweet)
+        now = time.time()
+        if now - last_report >= report_every:
+            last_report = now
+            if os.path.getmtime(catalog) != mtime:
+                mtime = os.path.getmtime(catalog)
+                matcher.set_quakes(earthquakes_from_file(catalog))
+                logging.info("reloaded {0}".format(catalog))
+            log_stats(matcher)
+    log_stats(matcher)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('catalog', help='USGS GeoJSON earthquake feed.')
+    parser.add_argument('data_dir', help='Directory for the quake files.')
+    parser.add_argument('-r', '--replay', nargs='+',
+                        help='Replay JSONL tweet files instead of streaming.')
+    parser.add_argument('--queue-size', type=int, default=10000,
+                        help='Matched tweets buffered for the writer.')
+    parser.add_argument('--report-every', type=int, default=60,
+                        help='Seconds between logs of the per quake counts.')
+    try:
+        from stream_example import add_stream_arguments
+        add_stream_arguments(parser, required=False)
+    except ImportError:
+        # no twitter package, only --replay works
+        pass
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments()
+    if args.replay:
+        source = replay_source(args.replay)
+    else:
+        source = twitter_source(args)
+    writer = QuakeWriter(args.data_dir, args.queue_size)
+    matcher = QuakeMatcher(earthquakes_from_file(args.catalog), writer.put)
+    try:
+        run(source, args.catalog, matcher, args.report_every)
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    main()
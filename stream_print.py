@@ -1,55 +1,248 @@
 #!/usr/bin/env python
 from __future__ import print_function
+import os
 import json
 import sys
 import re
+import mmap
+import argparse
+
+import numpy as np
+
+from tweet_io import open_tweet_file, is_compressed
 
 """
 remove lady gaga, panda, wrestling, sex
 """
 
-def main():
-    geo = 0
+# bytes of a tweet file scanned at once by fast_file_stats
+BLOCK_SIZE = 1 << 20
+QUOTE = ord('"')
+COLON = ord(':')
+SPACE = ord(' ')
+NEWLINE = ord('\n')
+(OPEN_BRACE, OPEN_BRACKET) = (ord('{'), ord('['))
+(CLOSE_BRACE, CLOSE_BRACKET) = (ord('}'), ord(']'))
+WHITESPACE = [ord(x) for x in ' \t\r']
+
+#   obj_stats :: Dict -> (Int, Int, Int)
+def obj_stats(obj):
+    """Whether a decoded tweet is geotagged, has a text and is a retweet"""
+    count = int("text" in obj)
+    retweet = int("retweeted_status" in obj or
+                  ("text" in obj and bool(re.match("^RT", obj["text"]))))
+    geo = int("geo" in obj and obj["geo"] != None)
+    return (geo, count, retweet)
+
+#   file_stats :: Filename -> IO (Int, Int, Int)
+def file_stats(earthquake):
+    """The geotagged, text and retweet counts of a tweet file"""
     count = 0
+    geo = 0
     retweet = 0
-    earthquakes = sys.argv[1:]
-    for earthquake in earthquakes:
-        count = 0
-        geo = 0
-        retweet = 0
-        with open(earthquake, "r") as eq_file:
-            for line in eq_file:
-                line = line.strip()
-                if len(line):
-                    try:
-                        obj = json.loads(line)
-                    except ValueError:
-                        continue
-                """
-                print(sorted(obj.keys()))
-                print(json.dumps(obj, sort_keys=True,
-                indent=4, separators=(',', ': ')))
-                """
-                #if "text" in obj and re.match("^RT", obj["text"]):
-                if "text" in obj:
-                #print(json.dumps(obj, sort_keys=True, indent=4,
-                #                 separators=(',', ': ')))
-                #print("retweeted_status" in obj)
-                    #print(obj["text"].encode('utf-8', 'ignore'))
-                    count += 1
-                
-                if "retweeted_status" in obj or ("text" in obj and re.match("^RT", obj["text"])):
-                    retweet += 1
-                if "geo" in obj:
-                    #print("geo: {0}".format(obj["geo"]))
-                    if obj["geo"] != None:
-                        geo += 1
+    with open_tweet_file(earthquake) as eq_file:
+        for line in eq_file:
+            line = line.strip()
+            if not len(line):
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
             """
-            if "id" in obj:
-                print(obj["id"])
+            print(sorted(obj.keys()))
+            print(json.dumps(obj, sort_keys=True,
+            indent=4, separators=(',', ': ')))
             """
-            #print("count {0}, geo_count {1}, retweet {2}, file {3}".format(count, geo, retweet, eqarthquake))
-            print("{0}\t{1}\t{2}".format(earthquake, geo, count))
+            (is_geo, has_text, is_retweet) = obj_stats(obj)
+            geo += is_geo
+            count += has_text
+            retweet += is_retweet
+        """
+        if "id" in obj:
+            print(obj["id"])
+        """
+    return (geo, count, retweet)
+
+'''--------------------------------------------------------------------------'''
+'''Fast scan'''
+'''--------------------------------------------------------------------------'''
+#   file_blocks :: Filename -> IO Iterator String
+def file_blocks(filename, block_size=BLOCK_SIZE):
+    """
+    A tweet file in blocks of whole lines, memory mapped when it is plain
+    and decompressed with tweet_io when it is not.
+    """
+    if is_compressed(filename):
+        with open_tweet_file(filename) as tweet_file:
+            lines = []
+            size = 0
+            for line in tweet_file:
+                lines.append(line)
+                size += len(line)
+                if size >= block_size:
+                    yield "".join(lines)
+                    (lines, size) = ([], 0)
+            if lines:
+                yield "".join(lines)
+        return
+    if not os.path.getsize(filename):
+        return
+    with open(filename, "rb") as tweet_file:
+        data = mmap.mmap(tweet_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < len(data):
+                end = data.find("\n", min(start + block_size, len(data)) - 1)
+                end = len(data) if end < 0 else end + 1
+                yield data[start:end]
+                start = end
+        finally:
+            data.close()
+
+#   _key_positions :: Array Int -> Array Int -> Array Int -> String -> Maybe Array Int
+def _key_positions(data, opening, closing, key):
+    """
+    The closing quotes of the strings that are key, where the next byte
+    is the colon after it or a space and the colon.  None when a string key
+    is spaced from its colon any other way.
+    """
+    pairs = np.flatnonzero(closing - opening == len(key) + 1)
+    for (offset, char) in enumerate(key):
+        pairs = pairs[data[opening[pairs] + 1 + offset] == ord(char)]
+    ends = closing[pairs]
+    after = data[ends + 1]
+    spaced = np.in1d(after, WHITESPACE)
+    if (spaced & (data[ends + 2] != COLON)).any() or \
+       (spaced & (after != SPACE)).any():
+        return None
+    return ends[(after == COLON) | spaced]
+
+#   _value_starts :: Array Int -> Array Int -> String -> Maybe Array Bool
+def _value_starts(data, keys, prefix):
+    """Whether the value after each key starts with prefix"""
+    colon = keys + 1 + (data[keys + 1] == SPACE)
+    start = colon + 1 + (data[colon + 1] == SPACE)
+    if np.in1d(data[start], WHITESPACE).any():
+        return None
+    starts = np.ones(len(keys), dtype=bool)
+    for (offset, char) in enumerate(prefix):
+        starts &= data[start + offset] == ord(char)
+    return starts
+
+#   block_stats :: String -> Maybe (Int, Int, Int)
+def block_stats(block):
+    """
+    The file_stats counts of a block of whole lines without decoding them,
+    or None when a line is not a whole json value (like a truncated one) or
+    is spaced unlike any json encoder does.  Only the quotes and braces are
+    looked at: the quotes pair up into strings, the braces and brackets
+    outside them give the depth, and the "text", "geo" and
+    "retweeted_status" keys at depth 1 are the ones of the line's object.
+    """
+    # same length, so positions still line up with block, plus room to look
+    # past the last byte
+    unescaped = block.replace("\\\\", "__").replace('\\"', "__") + " " * 8
+    data = np.frombuffer(unescaped, dtype=np.uint8)
+    ends = np.append(np.flatnonzero(data[:len(block)] == NEWLINE), len(block))
+    quotes = np.flatnonzero(data == QUOTE)
+    if (np.searchsorted(quotes, ends) & 1).any():
+        return None
+    (opening, closing) = (quotes[0::2], quotes[1::2])
+    marks = np.flatnonzero((data == OPEN_BRACE) | (data == OPEN_BRACKET) |
+                           (data == CLOSE_BRACE) | (data == CLOSE_BRACKET))
+    marks = marks[(np.searchsorted(quotes, marks) & 1) == 0]
+    kinds = data[marks]
+    depth = np.cumsum(np.where((kinds == OPEN_BRACE) |
+                               (kinds == OPEN_BRACKET), 1, -1))
+    line_ends = np.searchsorted(marks, ends) - 1
+    if (depth < 0).any() or \
+       depth[line_ends[line_ends >= 0]].any():
+        return None
+
+    def top_level(keys):
+        before = np.searchsorted(marks, keys) - 1
+        return keys[(before >= 0) & (depth[np.maximum(before, 0)] == 1)]
+
+    keys = [_key_positions(data, opening, closing, x)
+            for x in ("text", "geo", "retweeted_status")]
+    if any(x is None for x in keys):
+        return None
+    (texts, geos, retweets) = [top_level(x) for x in keys]
+    (rt_texts, null_geos) = (_value_starts(data, texts, '"RT'),
+                             _value_starts(data, geos, "null"))
+    if rt_texts is None or null_geos is None:
+        return None
+    retweet_lines = np.union1d(np.searchsorted(ends, retweets),
+                               np.searchsorted(ends, texts[rt_texts]))
+    return (int((~null_geos).sum()), len(texts), len(retweet_lines))
+
+#   fast_file_stats :: Filename -> IO (Int, Int, Int)
+def fast_file_stats(filename):
+    """
+    file_stats from block_stats, decoding only the lines of the blocks it
+    cannot settle.
+    """
+    count = 0
+    geo = 0
+    retweet = 0
+    for block in file_blocks(filename):
+        stats = block_stats(block)
+        if stats is None:
+            stats = [0, 0, 0]
+            for line in block.split("\n"):
+                line = line.strip()
+                if not len(line):
+                    continue
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    continue
+                stats = [x + y for (x, y) in zip(stats, obj_stats(obj))]
+        geo += stats[0]
+        count += stats[1]
+        retweet += stats[2]
+    return (geo, count, retweet)
+
+#   stats_job :: (Filename, Bool) -> IO (Int, Int, Int)
+def stats_job((filename, fast)):
+    return fast_file_stats(filename) if fast else file_stats(filename)
+
+#   all_file_stats :: [Filename] -> Bool -> Int -> IO [(Int, Int, Int)]
+def all_file_stats(filenames, fast=False, workers=1):
+    """The file_stats of each file, in order, workers files at a time"""
+    jobs = [(x, fast) for x in filenames]
+    if workers > 1 and len(jobs) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            return pool.map(stats_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return map(stats_job, jobs)
+
+#   add_stats_arguments :: ArgumentParser -> ()
+def add_stats_arguments(parser):
+    parser.add_argument('-f', '--fast', action='store_true',
+                        help='Scan the files without decoding the tweets.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Files scanned at once.')
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Geotagged and total tweet counts of tweet files.')
+    parser.add_argument('earthquakes', nargs='*', help='Tweet files.')
+    add_stats_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    earthquakes = args.earthquakes
+    stats = all_file_stats(earthquakes, args.fast, args.workers)
+    for (earthquake, (geo, count, retweet)) in zip(earthquakes, stats):
+        #print("count {0}, geo_count {1}, retweet {2}, file {3}".format(count, geo, retweet, eqarthquake))
+        print("{0}\t{1}\t{2}".format(earthquake, geo, count))
 
 
 if __name__ == "__main__":
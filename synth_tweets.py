@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Deterministic generator of synthetic tweet files shaped like the REST search
+results: one JSON tweet per line, newest first, around a quake and named
+mag_lat_lon_date.json like the real quake files.  The share of duplicates,
+retweets, geotagged tweets and each language is configurable, and the same
+seed always gives the same file.
+"""
+
+from __future__ import print_function
+
+import os.path
+import json
+import math
+import random
+import argparse
+from collections import deque
+from datetime import datetime, timedelta
+
+from tweet_time import TWEET_FORMAT, INPUT_FORMAT
+
+# snowflake ids of November 2014
+FIRST_ID = 533000000000000000
+QUAKE_DATE = datetime(2014, 11, 16, 22, 33, 21)
+QUAKE_LAT = -37.682
+QUAKE_LON = 179.685
+QUAKE_MAG = 6.7
+# tweets spread over a day either side of the quake, a quarter before it,
+# half in a burst decaying over the BURST hours after it, a quarter later
+SPREAD = timedelta(days=1)
+BURST = timedelta(hours=4)
+DECAY = 3600.0
+# tweets a duplicate may repeat
+RECENT = 100
+LANGS = "en:0.8,ja:0.08,es:0.05,nl:0.04,in:0.03"
+
+WORDS = {
+    "en": ("earthquake quake shaking felt just big strong house whole "
+           "building woke up scary magnitude near coast tsunami warning "
+           "everyone okay still aftershock the a and was that felt that "
+           "wow my in of to is it").split(),
+    "ja": u"地震 揺れ 津波 震度 大きい 怖い 今".split(),
+    "es": "terremoto sismo temblor fuerte casa todos bien ahora".split(),
+    "nl": "aardbeving beving huis sterk iedereen nu goed".split(),
+    "in": "gempa bumi kuat rumah semua sekarang".split(),
+}
+DEFAULT_WORDS = WORDS["en"]
+
+#   parse_mix :: String -> [(String, Float)]
+def parse_mix(text):
+    """ "en:0.8,ja:0.2" as [("en", 0.8), ("ja", 0.2)] """
+    mix = []
+    for item in text.split(","):
+        (lang, share) = item.split(":")
+        mix.append((lang, float(share)))
+    return mix
+
+#   synth_filename :: Float -> Float -> Float -> Datetime -> Filename
+def synth_filename(mag=QUAKE_MAG, lat=QUAKE_LAT, lon=QUAKE_LON,
+                   date=QUAKE_DATE):
+    return "{0}_{1}_{2}_{3}.json".format(mag, lat, lon,
+                                         date.strftime(INPUT_FORMAT))
+
+class TweetGenerator(object):
+    """Synthetic tweets around one quake, drawn from a seeded random"""
+    def __init__(self, seed=0, duplicates=0.02, retweets=0.3, geo=0.02,
+                 langs=LANGS, users=10000, lat=QUAKE_LAT, lon=QUAKE_LON,
+                 date=QUAKE_DATE):
+        self.random = random.Random(seed)
+        self.duplicates = duplicates
+        self.retweets = retweets
+        self.geo = geo
+        self.langs = parse_mix(langs)
+        self.lang_total = sum(share for (_, share) in self.langs)
+        self.users = users
+        self.lat = lat
+        self.lon = lon
+        self.date = date
+        self.recent = deque(maxlen=RECENT)
+
+    def _lang(self):
+        pick = self.random.random() * self.lang_total
+        for (lang, share) in self.langs:
+            pick -= share
+            if pick < 0:
+                return lang
+        return self.langs[-1][0]
+
+    def _text(self, lang):
+        words = WORDS.get(lang, DEFAULT_WORDS)
+        return u" ".join(self.random.choice(words)
+                         for _ in range(self.random.randint(4, 18)))
+
+    def _user(self, number):
+        return {"id": number, "id_str": str(number),
+                "screen_name": "user{0}".format(number),
+                "name": "User {0}".format(number),
+                "location": "", "description": "",
+                "followers_count": number % 997, "friends_count": number % 331,
+                "statuses_count": number % 7919, "lang": "en",
+                "geo_enabled": number % 3 == 0, "verified": False,
+                "profile_image_url": "http://pbs.twimg.com/profile_images/"
+                                     "{0}/normal.png".format(number)}
+
+    #   _date :: Float -> Datetime
+    def _date(self, quantile):
+        """
+        The date at a quantile of the tweet times.  It grows with the
+        quantile, so falling quantiles give tweets newest first.
+        """
+        spread = SPREAD.total_seconds()
+        burst = BURST.total_seconds()
+        if quantile < 0.25:
+            seconds = -spread * (1 - quantile / 0.25)
+        elif quantile < 0.75:
+            share = (quantile - 0.25) / 0.5 * (1 - math.exp(-burst / DECAY))
+            seconds = -DECAY * math.log(1 - share)
+        else:
+            seconds = burst + (spread - burst) * (quantile - 0.75) / 0.25
+        return self.date + timedelta(seconds=int(seconds))
+
+    #   tweet :: Int -> Datetime -> Dict
+    def tweet(self, number, date):
+        lang = self._lang()
+        tweet_id = FIRST_ID + number
+        tweet = {"id": tweet_id, "id_str": str(tweet_id),
+                 "created_at": date.strftime(TWEET_FORMAT),
+                 "text": self._text(lang), "lang": lang,
+                 "user": self._user(self.random.randint(1, self.users)),
+                 "coordinates": None, "geo": None, "place": None,
+                 "truncated": False, "retweet_count": 0,
+                 "favorite_count": 0, "metadata": {"result_type": "recent",
+                                                   "iso_language_code": lang},
+                 "entities": {"hashtags": [], "urls": [], "symbols": [],
+                              "user_mentions": []}}
+        if self.random.random() < self.geo:
+            lat = self.lat + self.random.gauss(0, 1.0)
+            lon = (self.lon + self.random.gauss(0, 1.0) + 180) % 360 - 180
+            tweet["coordinates"] = {"type": "Point", "coordinates": [lon, lat]}
+            tweet["geo"] = {"type": "Point", "coordinates": [lat, lon]}
+        if self.random.random() < self.retweets:
+            original = dict(tweet, id=tweet_id - 1000000,
+                            id_str=str(tweet_id - 1000000))
+            tweet["retweeted_status"] = original
+            tweet["text"] = u"RT @{0}: {1}".format(
+                original["user"]["screen_name"], original["text"])
+        return tweet
+
+    #   tweets :: Int -> Iterator Dict
+    def tweets(self, count):
+        """
+        count tweets newest first, like the REST search, some of them
+        repeats of recent ones.
+        """
+        for number in range(count):
+            if self.recent and self.random.random() < self.duplicates:
+                yield self.random.choice(self.recent)
+                continue
+            quantile = (count - number - self.random.random()) / float(count)
+            tweet = self.tweet(count - number, self._date(quantile))
+            self.recent.append(tweet)
+            yield tweet
+
+#   write_tweets :: Filename -> Int -> TweetGenerator -> IO ()
+def write_tweets(filename, count, generator):
+    with open(filename + ".tmp", "w") as out:
+        for tweet in generator.tweets(count):
+            out.write(json.dumps(tweet))
+            out.write("\n")
+    os.rename(filename + ".tmp", filename)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    parser.add_argument('out_dir', help='Directory for the tweet file.')
+    parser.add_argument('-n', '--count', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicates', type=float, default=0.02)
+    parser.add_argument('--retweets', type=float, default=0.3)
+    parser.add_argument('--geo', type=float, default=0.02)
+    parser.add_argument('--langs', default=LANGS,
+                        help='Language mix like "en:0.8,ja:0.2".')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    generator = TweetGenerator(args.seed, args.duplicates, args.retweets,
+                               args.geo, args.langs)
+    filename = os.path.join(args.out_dir, synth_filename())
+    write_tweets(filename, args.count, generator)
+    print(filename)
+
+if __name__ == "__main__":
+    main()
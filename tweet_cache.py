@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Columnar sidecar cache of parsed tweet files.  The first read of a tweet file
+writes a directory next to it (file.cols) of NumPy arrays, one per field, and
+later reads memory map those instead of decoding the json again.  The cache
+is rebuilt when the size or mtime of the tweet file changes.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import json
+import shutil
+import logging
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+from tweet_io import open_tweet_file
+from tweet_time import TWEET_FORMAT, created_seconds
+
+CACHE_VERSION = 2
+CACHE_EXTENSION = ".cols"
+# created_at of tweets without a usable one, before any real time
+NO_TIME = np.iinfo(np.int64).min
+# id of tweets without one
+NO_ID = -1
+LANG_DTYPE = "S8"
+
+#   cache_path :: Filename -> Filename
+def cache_path(filename):
+    return filename + CACHE_EXTENSION
+
+#   file_signature :: Filename -> IO Dict
+def file_signature(filename):
+    stat = os.stat(filename)
+    return {"version": CACHE_VERSION, "size": stat.st_size,
+            "mtime": stat.st_mtime}
+
+#   meta_matches :: Filename -> Dict -> IO Bool
+def meta_matches(meta_path, signature):
+    """Whether the json meta file exists and agrees with the signature"""
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r") as meta_file:
+        meta = json.load(meta_file)
+    return all(meta.get(key) == value for key, value in signature.items())
+
+#   cache_fresh :: Filename -> IO Bool
+def cache_fresh(filename):
+    return meta_matches(os.path.join(cache_path(filename), "meta.json"),
+                        file_signature(filename))
+
+#   created_epoch :: Dict -> Int
+def created_epoch(tweet):
+    """
+    Epoch seconds of a decoded tweet, from its snowflake id when its
+    created_at is missing or malformed, else NO_TIME.
+    """
+    try:
+        return created_seconds(tweet, use_id=True)
+    except ValueError:
+        return NO_TIME
+
+#   build_columns :: Filename -> IO ()
+def build_columns(filename):
+    """Parses the tweet file once and writes its sidecar"""
+    directory = cache_path(filename)
+    building = directory + ".tmp"
+    if os.path.exists(building):
+        shutil.rmtree(building)
+    os.mkdir(building)
+    signature = file_signature(filename)
+    columns = {"id": array("l"), "created_at": array("l"),
+               "retweet": array("B"), "has_text": array("B"),
+               "lon": array("d"), "lat": array("d"),
+               "offset": array("l"), "text_offset": array("l", [0])}
+    langs = []
+    offset = 0
+    text_offset = 0
+    with open_tweet_file(filename) as tweet_file, \
+         open(os.path.join(building, "text.bin"), "wb") as text_file:
+        for line in tweet_file:
+            line_offset = offset
+            offset += len(line)
+            line = line.strip()
+            if not len(line):
+                continue
+            try:
+                tweet = json.loads(line)
+            except ValueError:
+                continue
+            columns["id"].append(tweet.get("id", NO_ID))
+            columns["created_at"].append(created_epoch(tweet))
+            columns["retweet"].append("retweeted_status" in tweet)
+            langs.append((tweet.get("lang") or "").encode("utf-8"))
+            coordinates = tweet.get("coordinates")
+            if coordinates is not None:
+                columns["lon"].append(coordinates["coordinates"][0])
+                columns["lat"].append(coordinates["coordinates"][1])
+            else:
+                columns["lon"].append(np.nan)
+                columns["lat"].append(np.nan)
+            columns["offset"].append(line_offset)
+            columns["has_text"].append("text" in tweet)
+            text = (tweet.get("text") or u"").encode("utf-8")
+            text_file.write(text)
+            text_offset += len(text)
+            columns["text_offset"].append(text_offset)
+
+    for name, values in columns.items():
+        values = np.frombuffer(values, dtype=values.typecode)
+        if name in ("retweet", "has_text"):
+            values = values.astype(bool)
+        np.save(os.path.join(building, name + ".npy"), values)
+    np.save(os.path.join(building, "lang.npy"),
+            np.array(langs, dtype=LANG_DTYPE))
+    with open(os.path.join(building, "meta.json"), "w") as meta_file:
+        json.dump(dict(signature, count=len(langs)), meta_file)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(building, directory)
+
+class TweetColumns(object):
+    """The memory mapped columns of one tweet file, one row per tweet"""
+    def __init__(self, directory):
+        def column(name):
+            return np.load(os.path.join(directory, name + ".npy"),
+                           mmap_mode='r')
+        self.id = column("id")
+        self.created_at = column("created_at")
+        self.lang = column("lang")
+        self.retweet = column("retweet")
+        self.has_text = column("has_text")
+        self.lon = column("lon")
+        self.lat = column("lat")
+        self.offset = column("offset")
+        self.text_offset = column("text_offset")
+        text_path = os.path.join(directory, "text.bin")
+        if os.path.getsize(text_path):
+            self.text_blob = np.memmap(text_path, dtype=np.uint8, mode='r')
+        else:
+            self.text_blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.id)
+
+    #   rows_between :: Int -> Int -> Array Int
+    def rows_between(self, low, high):
+        """Rows created in [low, high] epoch seconds, in file order"""
+        created_at = self.created_at
+        return np.flatnonzero((created_at >= low) & (created_at <= high))
+
+    #   text :: Int -> String
+    def text(self, row):
+        return self.slice_text(self.text_offset[row],
+                               self.text_offset[row + 1])
+
+    #   slice_text :: Int -> Int -> String
+    def slice_text(self, start, end):
+        """Text between two byte offsets of text.bin"""
+        return self.text_blob[start:end].tostring().decode("utf-8")
+
+    #   tweet :: Int -> Dict
+    def tweet(self, row):
+        """
+        The row as a tweet dict with the fields the analysis uses: id,
+        created_at, lang, text, coordinates and retweeted_status (True for
+        retweets)
+        """
+        tweet = {"coordinates": None}
+        if self.id[row] != NO_ID:
+            tweet["id"] = int(self.id[row])
+        if self.created_at[row] != NO_TIME:
+            date = datetime.utcfromtimestamp(self.created_at[row])
+            tweet["created_at"] = date.strftime(TWEET_FORMAT)
+        if len(self.lang[row]):
+            tweet["lang"] = self.lang[row].decode("utf-8")
+        if self.has_text[row]:
+            tweet["text"] = self.text(row)
+        if not np.isnan(self.lon[row]):
+            tweet["coordinates"] = {"type": "Point",
+                                    "coordinates": [float(self.lon[row]),
+                                                    float(self.lat[row])]}
+        if self.retweet[row]:
+            tweet["retweeted_status"] = True
+        return tweet
+
+#   load_columns :: Filename -> IO TweetColumns
+def load_columns(filename):
+    """
+    The columns of a tweet file, building or rebuilding its sidecar first
+    when it is missing or stale.
+    """
+    if not cache_fresh(filename):
+        logging.info("building cache for {0}".format(filename))
+        build_columns(filename)
+    return TweetColumns(cache_path(filename))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Time sorted index of the lines of a tweet file.  The index maps each tweet's
+created_at (epoch seconds) to the byte offset and length of its line and is
+stored next to the file (in file.tidx/), so a time window is read by
+bisecting the index and pulling only those lines out of a memory map of the
+file.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import json
+import mmap
+import logging
+
+import numpy as np
+
+from tweet_cache import file_signature, meta_matches, created_epoch, NO_TIME
+from tweet_io import is_compressed
+
+INDEX_VERSION = 2
+INDEX_EXTENSION = ".tidx"
+INDEX_DTYPE = [("time", np.int64), ("offset", np.int64), ("length", np.int64)]
+
+#   index_paths :: Filename -> (Filename, Filename)
+def index_paths(filename):
+    """The index array and its meta file"""
+    directory = filename + INDEX_EXTENSION
+    return (os.path.join(directory, "index.npy"),
+            os.path.join(directory, "meta.json"))
+
+#   index_signature :: Filename -> IO Dict
+def index_signature(filename):
+    return dict(file_signature(filename), version=INDEX_VERSION)
+
+#   build_index :: Filename -> IO ()
+def build_index(filename):
+    """Decodes every line once and writes the index sorted by time"""
+    (index_path, meta_path) = index_paths(filename)
+    if not os.path.isdir(os.path.dirname(index_path)):
+        os.mkdir(os.path.dirname(index_path))
+    signature = index_signature(filename)
+    entries = []
+    offset = 0
+    with open(filename, "rb") as tweet_file:
+        for line in tweet_file:
+            line_offset = offset
+            offset += len(line)
+            stripped = line.strip()
+            if not len(stripped):
+                continue
+            try:
+                tweet = json.loads(stripped)
+            except ValueError:
+                continue
+            time = created_epoch(tweet)
+            if time != NO_TIME:
+                entries.append((time, line_offset, len(line)))
+    index = np.array(entries, dtype=INDEX_DTYPE)
+    # stable, so lines with the same time stay in file order
+    index = index[np.argsort(index["time"], kind="mergesort")]
+    with open(index_path + ".tmp", "wb") as index_file:
+        np.save(index_file, index)
+    os.rename(index_path + ".tmp", index_path)
+    with open(meta_path, "w") as meta_file:
+        json.dump(dict(signature, count=len(index)), meta_file)
+
+#   load_index :: Filename -> IO (Array)
+def load_index(filename):
+    """The memory mapped index of a tweet file, built first if stale"""
+    (index_path, meta_path) = index_paths(filename)
+    if not os.path.exists(index_path) or \
+       not meta_matches(meta_path, index_signature(filename)):
+        logging.info("building index for {0}".format(filename))
+        build_index(filename)
+    return np.load(index_path, mmap_mode='r')
+
+#   window_lines :: Filename -> Int -> Int -> IO ([String])
+def window_lines(filename, low, high):
+    """
+    The lines of the tweet file created in [low, high] epoch seconds, in
+    file order.
+    """
+    if is_compressed(filename):
+        raise IOError("{0} is compressed, its lines cannot be "
+                      "indexed".format(filename))
+    index = load_index(filename)
+    times = index["time"]
+    first = np.searchsorted(times, low, side="left")
+    last = np.searchsorted(times, high, side="right")
+    if first >= last:
+        return []
+    window = np.sort(index[first:last], order="offset")
+    lines = []
+    with open(filename, "rb") as tweet_file:
+        data = mmap.mmap(tweet_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for (_, offset, length) in window:
+                lines.append(data[offset:offset + length])
+        finally:
+            data.close()
+    return lines
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+Opens tweet files that may be gzip, bz2 or zstd compressed, told apart by
+their magic bytes (or, for an empty file, their extension).  Compressed
+files are decompressed a chunk at a time on a background thread while the
+caller works through the lines, so parsing overlaps decompression, and
+several files are decompressed at once when they are handled by worker
+processes (rest_data_process -w).
+"""
+
+from __future__ import print_function
+
+import os.path
+import bz2
+import functools
+import zlib
+import threading
+import Queue
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PLAIN = "plain"
+GZIP = "gzip"
+BZIP2 = "bz2"
+ZSTD = "zstd"
+MAGIC = [("\x1f\x8b", GZIP), ("BZh", BZIP2), ("\x28\xb5\x2f\xfd", ZSTD)]
+EXTENSIONS = {".gz": GZIP, ".bz2": BZIP2, ".zst": ZSTD}
+CHUNK_SIZE = 1 << 20
+# decompressed chunks the background thread may run ahead by
+PREFETCH = 8
+
+#   compression :: Filename -> IO String
+def compression(filename):
+    """PLAIN, GZIP, BZIP2 or ZSTD"""
+    with open(filename, "rb") as tweet_file:
+        head = tweet_file.read(4)
+    for (magic, kind) in MAGIC:
+        if head.startswith(magic):
+            return kind
+    if not head:
+        return EXTENSIONS.get(os.path.splitext(filename)[1], PLAIN)
+    return PLAIN
+
+#   is_compressed :: Filename -> IO Bool
+def is_compressed(filename):
+    return compression(filename) != PLAIN
+
+#   strip_compression :: Filename -> Filename
+def strip_compression(filename):
+    """The filename without its .gz, .bz2 or .zst suffix, if it has one"""
+    (root, extension) = os.path.splitext(filename)
+    return root if extension in EXTENSIONS else filename
+
+def _decompressor(kind):
+    """A fresh decompressobj like object for one stream of kind"""
+    if kind == GZIP:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if kind == BZIP2:
+        return bz2.BZ2Decompressor()
+    return zstandard.ZstdDecompressor().decompressobj()
+
+#   decompressed_chunks :: File -> String -> Iterator String
+def decompressed_chunks(raw_file, kind, chunk_size=CHUNK_SIZE):
+    """
+    The decompressed data of a compressed file, a chunk at a time.  Files
+    of several concatenated streams, like appended gzip members, are read
+    through to the end.
+    """
+    decompressor = _decompressor(kind)
+    while True:
+        data = raw_file.read(chunk_size)
+        if not data:
+            break
+        while data:
+            try:
+                chunk = decompressor.decompress(data)
+            except EOFError:
+                # a bz2 stream ended right at the end of the last read
+                decompressor = _decompressor(kind)
+                continue
+            if chunk:
+                yield chunk
+            data = getattr(decompressor, "unused_data", "")
+            if data:
+                decompressor = _decompressor(kind)
+    flush = getattr(decompressor, "flush", None)
+    if flush is not None:
+        chunk = flush()
+        if chunk:
+            yield chunk
+
+#   prefetched :: Iterator a -> Event -> Int -> Iterator a
+def prefetched(items, stop, depth=PREFETCH):
+    """
+    The items of an iterator, produced on a background thread up to depth
+    ahead of the consumer, until stop is set.  zlib and bz2 release the GIL
+    while they work, so the decompression really runs alongside the caller.
+    """
+    queue = Queue.Queue(depth)
+    done = object()
+    failure = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                put(item)
+        except Exception as err:
+            failure.append(err)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    while True:
+        item = queue.get()
+        if item is done:
+            break
+        yield item
+    thread.join()
+    if failure:
+        raise failure[0]
+
+#   split_lines :: Iterator String -> Iterator String
+def split_lines(chunks):
+    """The lines of chunked data, each with its newline like a file's"""
+    rest = ""
+    for chunk in chunks:
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if rest:
+        yield rest
+
+class TweetFile(object):
+    """
+    The lines of a possibly compressed tweet file, iterated like a file
+    opened for reading and closed with close or a with block.
+    """
+    def __init__(self, filename, kind):
+        if kind == ZSTD and zstandard is None:
+            raise IOError("{0} is zstd compressed and the zstandard module "
+                          "is not installed".format(filename))
+        self.name = filename
+        self.kind = kind
+        self.raw_file = open(filename, "rb")
+        self.stop = threading.Event()
+        if kind == PLAIN:
+            self.lines = iter(self.raw_file)
+        else:
+            self.lines = split_lines(prefetched(
+                decompressed_chunks(self.raw_file, kind), self.stop))
+
+    def __iter__(self):
+        return self.lines
+
+    def next(self):
+        return next(self.lines)
+
+    def close(self):
+        self.stop.set()
+        self.raw_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+#   open_tweet_file :: Filename -> IO TweetFile
+def open_tweet_file(filename):
+    """Opens a plain, gzip, bz2 or zstd tweet file for reading its lines"""
+    return TweetFile(filename, compression(filename))
+
+#   file_chunks :: Filename -> IO Iterator String
+def file_chunks(filename, chunk_size=CHUNK_SIZE):
+    """
+    The data of a plain, gzip, bz2 or zstd file a chunk at a time, for files
+    that are not read by lines, like a feed that is one long line.
+    """
+    kind = compression(filename)
+    if kind == ZSTD and zstandard is None:
+        raise IOError("{0} is zstd compressed and the zstandard module "
+                      "is not installed".format(filename))
+    with open(filename, "rb") as raw_file:
+        if kind == PLAIN:
+            chunks = iter(functools.partial(raw_file.read, chunk_size), "")
+        else:
+            chunks = decompressed_chunks(raw_file, kind, chunk_size)
+        for chunk in chunks:
+            yield chunk
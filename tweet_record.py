@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Compact records of the tweet fields the analysis uses, in place of the full
+decoded dicts with their nested user, entities and retweeted_status.  A
+TweetRecord keeps numbers for the id, time and coordinates, shares its
+language string with the other records, and keeps its text in a string
+arena (one utf-8 buffer for many records, or the text.bin of a columnar
+sidecar).  It answers the dict lookups of the analysis functions, so
+unique_by_id, wordcounts_by_lang, graph_tweets and geo_count take records
+and dicts alike.
+"""
+
+from __future__ import print_function
+
+from datetime import datetime
+
+import numpy as np
+
+from tweet_cache import created_epoch, NO_ID, NO_TIME
+from tweet_time import TWEET_FORMAT, created_seconds
+
+class StringArena(object):
+    """The texts of many records, back to back in one utf-8 buffer"""
+    def __init__(self):
+        self.data = bytearray()
+
+    #   add :: String -> (Int, Int)
+    def add(self, text):
+        start = len(self.data)
+        self.data += text.encode("utf-8")
+        return (start, len(self.data))
+
+    #   slice_text :: Int -> Int -> String
+    def slice_text(self, start, end):
+        return str(self.data[start:end]).decode("utf-8")
+
+# one string object per language code for all the records
+_langs = {}
+
+#   shared_lang :: String -> String
+def shared_lang(lang):
+    return _langs.setdefault(lang, lang)
+
+class TweetRecord(object):
+    """
+    id, created_at, lang, text, coordinates and retweeted_status of a tweet,
+    read like a dict.  As in the decoded tweets, "coordinates" is always
+    there (None when not geotagged) and "retweeted_status" only for retweets,
+    where it is True instead of the original tweet.
+    """
+    __slots__ = ("id", "created", "lang", "lon", "lat", "retweet", "arena",
+                 "start", "end")
+
+    def __init__(self, id, created, lang, lon, lat, retweet, arena, start,
+                 end):
+        self.id = id
+        self.created = created
+        self.lang = lang
+        self.lon = lon
+        self.lat = lat
+        self.retweet = retweet
+        self.arena = arena
+        self.start = start
+        self.end = end
+
+    @property
+    def text(self):
+        if self.start is None:
+            return None
+        return self.arena.slice_text(self.start, self.end)
+
+    @property
+    def coordinates(self):
+        if self.lon is None:
+            return None
+        return {"type": "Point", "coordinates": [self.lon, self.lat]}
+
+    @property
+    def created_at(self):
+        if self.created is None:
+            return None
+        return datetime.utcfromtimestamp(self.created).strftime(TWEET_FORMAT)
+
+    def __contains__(self, key):
+        if key == "coordinates":
+            return True
+        if key == "retweeted_status":
+            return self.retweet
+        if key == "text":
+            return self.start is not None
+        if key in ("id", "lang"):
+            return getattr(self, key) is not None
+        if key == "created_at":
+            return self.created is not None
+        return False
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key == "retweeted_status":
+            return True
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+#   compact_tweet :: Dict -> StringArena -> Int -> TweetRecord
+def compact_tweet(tweet, arena, created=None):
+    """
+    The record of a decoded tweet, its text added to arena.  created is its
+    created_epoch, when the caller has already parsed it.
+    """
+    if created is None:
+        created = created_epoch(tweet)
+    lang = tweet.get("lang")
+    coordinates = tweet.get("coordinates")
+    (lon, lat) = (None, None)
+    if coordinates is not None:
+        (lon, lat) = coordinates["coordinates"][:2]
+    (start, end) = (None, None)
+    if "text" in tweet:
+        (start, end) = arena.add(tweet["text"] or u"")
+    return TweetRecord(tweet.get("id"),
+                       created if created != NO_TIME else None,
+                       shared_lang(lang) if lang is not None else None,
+                       lon, lat, "retweeted_status" in tweet,
+                       arena, start, end)
+
+#   column_record :: TweetColumns -> Int -> TweetRecord
+def column_record(columns, row):
+    """The record of a row of a columnar sidecar, whose text.bin is its arena"""
+    has_text = bool(columns.has_text[row])
+    lon = float(columns.lon[row])
+    lang = columns.lang[row]
+    return TweetRecord(int(columns.id[row]) if columns.id[row] != NO_ID
+                       else None,
+                       int(columns.created_at[row])
+                       if columns.created_at[row] != NO_TIME else None,
+                       shared_lang(lang.decode("utf-8")) if len(lang)
+                       else None,
+                       None if np.isnan(lon) else lon,
+                       None if np.isnan(lon) else float(columns.lat[row]),
+                       bool(columns.retweet[row]), columns,
+                       int(columns.text_offset[row]) if has_text else None,
+                       int(columns.text_offset[row + 1]) if has_text
+                       else None)
+
+#   tweet_epoch :: Tweet -> Int
+def tweet_epoch(tweet):
+    """created_at of a record or a decoded tweet in epoch seconds"""
+    if isinstance(tweet, TweetRecord):
+        return tweet.created
+    return created_seconds(tweet, use_id=True)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Times of tweets and quakes in epoch seconds.  created_at always has the
+fixed Twitter layout "Wed Nov 19 23:15:11 +0000 2014", so it is decoded by
+slicing out its fields instead of with strptime, and each distinct minute is
+converted only once: the epoch of its "Nov 19 23:15 +0000 2014" is kept and
+the seconds added to it.  A tweet without a usable created_at can be timed
+by its snowflake id instead.
+"""
+
+from __future__ import print_function
+
+import calendar
+from datetime import datetime
+
+# 2014-11-20 06:26:49 UTC
+INPUT_FORMAT = "%Y-%m-%d_%H:%M:%S"
+#"Wed Nov 19 23:15:11 +0000 2014"
+TWEET_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+CREATED_AT_LENGTH = len("Wed Nov 19 23:15:11 +0000 2014")
+# spelled out rather than taken from calendar, whose names follow the locale
+MONTHS = dict((name, number + 1) for (number, name) in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct",
+     "Nov", "Dec"]))
+# minutes whose epoch is kept, a year of them
+MINUTE_CACHE = 1 << 19
+# twitter's epoch of the snowflake ids, in milliseconds, and the first
+# snowflake id; the ids before it were sequential and hold no time
+TWEPOCH_MS = 1288834974657
+FIRST_SNOWFLAKE = 29700859247
+SNOWFLAKE_SHIFT = 22
+
+_minutes = {}
+
+def _minute_epoch(created_at):
+    """Epoch seconds of the minute of a created_at, checking all its fields"""
+    if len(created_at) != CREATED_AT_LENGTH or \
+       created_at[3] != " " or created_at[7] != " " or \
+       created_at[10] != " " or created_at[13] != ":" or \
+       created_at[19:26] != " +0000 " or created_at[4:7] not in MONTHS:
+        raise ValueError("not a created_at: {0!r}".format(created_at))
+    fields = (created_at[26:30], created_at[8:10], created_at[11:13],
+              created_at[14:16])
+    if not all(x.isdigit() for x in fields):
+        raise ValueError("not a created_at: {0!r}".format(created_at))
+    (year, day, hour, minute) = [int(x) for x in fields]
+    month = MONTHS[created_at[4:7]]
+    if not (1 <= year and 1 <= day <= calendar.monthrange(year, month)[1] and
+            hour < 24 and minute < 60):
+        raise ValueError("not a created_at: {0!r}".format(created_at))
+    return calendar.timegm((year, month, day, hour, minute, 0))
+
+#   parse_created_at :: String -> Int
+def parse_created_at(created_at):
+    """
+    Epoch seconds of a created_at, like strptime with TWEET_FORMAT but for
+    the weekday, which is not checked.  Raises ValueError when it is not one.
+    """
+    # "Nov 19 23:15 +0000 2014", only ever cached for well formed dates
+    key = created_at[4:16] + created_at[19:]
+    minute = _minutes.get(key)
+    if minute is None:
+        minute = _minute_epoch(created_at)
+        if len(_minutes) >= MINUTE_CACHE:
+            _minutes.clear()
+        _minutes[key] = minute
+    seconds = created_at[17:19]
+    if created_at[16] != ":" or not seconds.isdigit() or seconds > "61":
+        raise ValueError("not a created_at: {0!r}".format(created_at))
+    return minute + int(seconds)
+
+#   created_datetime :: String -> Datetime
+def created_datetime(created_at):
+    """The naive UTC datetime of a created_at"""
+    return datetime.utcfromtimestamp(parse_created_at(created_at))
+
+#   snowflake_epoch :: Int -> Int
+def snowflake_epoch(tweet_id):
+    """Epoch seconds at which the tweet of a snowflake id was created"""
+    tweet_id = int(tweet_id)
+    if tweet_id < FIRST_SNOWFLAKE:
+        raise ValueError("{0} is not a snowflake id".format(tweet_id))
+    return ((tweet_id >> SNOWFLAKE_SHIFT) + TWEPOCH_MS) // 1000
+
+#   created_seconds :: Dict -> Bool -> Int
+def created_seconds(tweet, use_id=False):
+    """
+    Epoch seconds of a decoded tweet's created_at, or with use_id of its
+    snowflake id when the created_at is missing or malformed.  Raises
+    ValueError when neither gives a time.
+    """
+    try:
+        return parse_created_at(tweet["created_at"])
+    except (KeyError, ValueError, TypeError):
+        if not use_id or tweet.get("id") is None:
+            raise ValueError("tweet without a created_at")
+    return snowflake_epoch(tweet["id"])
+
+#   parse_quake_date :: String -> Datetime
+def parse_quake_date(text):
+    """The datetime of a quake file's "2014-11-16_22:33:21" (INPUT_FORMAT)"""
+    if len(text) != 19 or text[4] != "-" or text[7] != "-" or \
+       text[10] != "_" or text[13] != ":" or text[16] != ":":
+        raise ValueError("not a quake date: {0!r}".format(text))
+    fields = (text[0:4], text[5:7], text[8:10], text[11:13], text[14:16],
+              text[17:19])
+    if not all(x.isdigit() for x in fields):
+        raise ValueError("not a quake date: {0!r}".format(text))
+    return datetime(*[int(x) for x in fields])
+
+#   millis_datetime :: Int -> Datetime
+def millis_datetime(millis):
+    """The naive UTC datetime of epoch milliseconds, as USGS times are"""
+    return datetime.utcfromtimestamp(millis / 1000.0)
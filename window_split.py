@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+Cuts the tweet windows of a whole earthquake catalog (2 hours before to 4
+hours after each quake) out of one large capture in a single pass, instead
+of one scan of the capture per quake.  The windows are put in an interval
+index, each tweet is written to every quake whose window holds it, and the
+lines of each quake file are buffered and appended a block at a time.  The
+quake files are named like the ones rest_search writes.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+import json
+import bisect
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from rest_data_process import window_seconds, usable_dates, line_id_times, \
+    CREATED_AT_RE
+from rest_search import earthquakes_from_file, earthquake_filename
+from dedup import IdSet
+from tweet_cache import created_epoch
+from tweet_io import open_tweet_file
+from tweet_time import parse_created_at
+import metrics
+
+# lines buffered for one quake file before they are appended to it
+BUFFER_LINES = 1000
+# bytes buffered over all the quake files before they are all written out
+MAX_BUFFERED = 64 << 20
+
+class WindowIndex(object):
+    """
+    The quakes whose window holds a time.  The window ends cut the time line
+    into elementary intervals, each with the tuple of quakes covering all of
+    it, so a lookup is one bisect however much the windows overlap.
+    """
+    def __init__(self, quakes):
+        windows = [(quake,) + window_seconds(quake.date) for quake in quakes]
+        # [low, high + 1), as window_seconds includes its last second
+        starts = {}
+        ends = {}
+        for (quake, low, high) in windows:
+            starts.setdefault(low, []).append(quake)
+            ends.setdefault(high + 1, []).append(quake)
+        self.edges = sorted(set(starts) | set(ends))
+        self.covering = []
+        active = set()
+        for edge in self.edges:
+            active.difference_update(ends.get(edge, []))
+            active.update(starts.get(edge, []))
+            self.covering.append(tuple(sorted(active, key=lambda x: x.date)))
+        # "Nov 19" and "2014" of each day touched by a window, as in
+        # timely_line_filter
+        self.days = set()
+        for (_, low, high) in windows:
+            day = datetime.utcfromtimestamp(low).date()
+            while day <= datetime.utcfromtimestamp(high).date():
+                self.days.add((day.strftime("%b %d"), day.strftime("%Y")))
+                day += timedelta(days=1)
+
+    def __len__(self):
+        return len(self.edges)
+
+    #   quakes_at :: Int -> (Quake)
+    def quakes_at(self, seconds):
+        """The quakes whose window holds the epoch seconds"""
+        segment = bisect.bisect_right(self.edges, seconds) - 1
+        if segment < 0:
+            return ()
+        return self.covering[segment]
+
+    #   maybe_covered :: String -> Bool
+    def maybe_covered(self, line):
+        """
+        Whether any created_at in a raw tweet line is in a window, or any id
+        of a line without usable ones, so lines that cannot be are skipped
+        without decoding them.
+        """
+        dates = set(CREATED_AT_RE.findall(line))
+        for created_at in dates:
+            if (created_at[4:10], created_at[-4:]) not in self.days:
+                continue
+            try:
+                if self.quakes_at(parse_created_at(created_at)):
+                    return True
+            except ValueError:
+                continue
+        if usable_dates(dates):
+            return False
+        return any(self.quakes_at(x) for x in line_id_times(line))
+
+class QuakeFiles(object):
+    """
+    The quake files of out_dir, written through per quake buffers.  A file
+    is only open while a block is appended to it, so hundreds of quakes do
+    not hold hundreds of files open.  Files written before are replaced.
+    """
+    def __init__(self, out_dir, buffer_lines=BUFFER_LINES,
+                 max_buffered=MAX_BUFFERED):
+        self.out_dir = out_dir
+        self.buffer_lines = buffer_lines
+        self.max_buffered = max_buffered
+        self.buffers = {}
+        self.buffered = 0
+        self.started = set()
+        self.counts = {}
+
+    #   path :: Quake -> Filename
+    def path(self, quake):
+        return os.path.join(self.out_dir, earthquake_filename(quake))
+
+    #   write :: Quake -> String -> IO ()
+    def write(self, quake, line):
+        buf = self.buffers.setdefault(quake, [])
+        buf.append(line)
+        self.buffered += len(line)
+        self.counts[quake] = self.counts.get(quake, 0) + 1
+        if len(buf) >= self.buffer_lines:
+            self.flush(quake)
+        elif self.buffered >= self.max_buffered:
+            self.flush_all()
+
+    #   flush :: Quake -> IO ()
+    def flush(self, quake):
+        buf = self.buffers.pop(quake, None)
+        if not buf:
+            return
+        mode = "ab" if quake in self.started else "wb"
+        self.started.add(quake)
+        with open(self.path(quake), mode) as quake_file:
+            quake_file.writelines(buf)
+        self.buffered -= sum(len(x) for x in buf)
+        metrics.count("blocks_written")
+
+    #   flush_all :: () -> IO ()
+    def flush_all(self):
+        for quake in self.buffers.keys():
+            self.flush(quake)
+
+    def close(self):
+        self.flush_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+#   split_windows :: Iterable String -> WindowIndex -> QuakeFiles -> IdSet -> IO ()
+def split_windows(lines, index, quake_files, seen=None):
+    """
+    Writes each tweet line to the file of every quake whose window holds
+    it, once per tweet id as timely_data keeps them.
+    """
+    if seen is None:
+        seen = IdSet()
+    (count, errors, rejects, duplicates) = (0, 0, 0, 0)
+    for line in lines:
+        count += 1
+        line = line.strip()
+        if not len(line):
+            continue
+        if not index.maybe_covered(line):
+            rejects += 1
+            continue
+        try:
+            tweet = json.loads(line)
+        except ValueError:
+            errors += 1
+            continue
+        quakes = index.quakes_at(created_epoch(tweet))
+        if not quakes:
+            rejects += 1
+            continue
+        if "id" not in tweet or not seen.add(tweet["id"]):
+            duplicates += 1
+            continue
+        for quake in quakes:
+            quake_files.write(quake, line + "\n")
+    metrics.count("lines_read", count)
+    metrics.count("json_errors", errors)
+    metrics.count("window_rejects", rejects)
+    metrics.count("duplicates_dropped", duplicates)
+    if errors:
+        logging.info("{0} lines that are not json".format(errors))
+
+#   input_lines :: [Filename] -> IO Iterator String
+def input_lines(filenames):
+    """The lines of the tweet files one after the other, else of stdin"""
+    if not filenames:
+        for line in sys.stdin:
+            yield line
+        return
+    for filename in filenames:
+        with open_tweet_file(filename) as tweet_file:
+            for line in tweet_file:
+                yield line
+
+#   add_split_arguments :: ArgumentParser -> ()
+def add_split_arguments(parser):
+    parser.add_argument('catalog', help='USGS GeoJSON earthquake feed.')
+    parser.add_argument('out_dir', help='Directory for the quake files.')
+    parser.add_argument('tweet_files', nargs='*',
+                        help='Tweet files, possibly compressed, else stdin.')
+    parser.add_argument('--buffer-lines', type=int, default=BUFFER_LINES,
+                        help='Lines buffered per quake before writing them.')
+
+#   main_split :: Namespace -> IO ()
+def main_split(args):
+    quakes = earthquakes_from_file(args.catalog)
+    index = WindowIndex(quakes)
+    logging.info("{0} quakes, {1} window edges".format(len(quakes),
+                                                       len(index)))
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+    with QuakeFiles(args.out_dir, args.buffer_lines) as quake_files:
+        split_windows(input_lines(args.tweet_files), index, quake_files)
+    for quake in sorted(quake_files.counts, key=lambda x: x.date):
+        print("{0}\t{1}".format(quake_files.path(quake),
+                                quake_files.counts[quake]))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__ or "")
+    add_split_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    main_split(parse_arguments())
+
+if __name__ == "__main__":
+    main()